@@ -0,0 +1,55 @@
+import threading
+
+class OperatingPoints:
+    """Picks the model input size for a request from its latency budget.
+
+    Keeps a running average of the per-frame inference time at each size and
+    the predicted inference time of the frames already waiting for the model.
+    A request gets the largest size whose inference is predicted to finish
+    within its budget, or the smallest one if none does.
+    """
+
+    def __init__(self, sizes, default, alpha=0.2):
+        self.sizes = sorted(set(sizes) | {default}, reverse=True)
+        self.default = default
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.backlog = 0.0
+
+    def seed(self, size, ms):
+        with self.lock:
+            self.latency[size] = ms
+
+    def observe(self, size, ms):
+        with self.lock:
+            average = self.latency.get(size)
+            self.latency[size] = ms if average is None else average + self.alpha * (ms - average)
+
+    def choose(self, budget_ms=None, spent_ms=0):
+        """Reserve a size for a frame; returns (size, cost_ms, predicted_ms).
+
+        cost_ms is added to the backlog until done(cost_ms); predicted_ms is
+        when the frame's inference should finish, counted from the request start.
+        """
+        with self.lock:
+            if budget_ms is None:
+                size = self.default
+            else:
+                fits = [size for size in self.sizes
+                        if spent_ms + self.backlog + self.latency.get(size, 0) <= budget_ms]
+                size = fits[0] if fits else self.sizes[-1]
+            cost = self.latency.get(size, 0)
+            predicted = spent_ms + self.backlog + cost
+            self.backlog += cost
+        return size, cost, round(predicted, 3)
+
+    def done(self, cost):
+        with self.lock:
+            self.backlog -= cost
+
+    def stats(self):
+        with self.lock:
+            values = {f"inference_ms_{size}": round(ms, 3) for size, ms in self.latency.items()}
+            values["inference_backlog_ms"] = round(max(self.backlog, 0), 3)
+        return values
@@ -1,13 +1,18 @@
-from ultralytics import YOLO
 import pickle
 import json
 import base64
 import os
-from ultralytics.utils import LOGGER
 import logging
-import cv2
 import numpy as np
 import sys
+import threading
+import time
+import itertools
+from .preprocess import Preprocessor
+from .deadline import OperatingPoints
+from .decode import decode_image
+from .modelclient import ModelClient
+from .postprocess import count_people
 
 os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"       # Disable OneDNN probing
 os.environ["TFLITE_ENABLE_XNNPACK"] = "1"       # Force-enable XNNPACK delegate
@@ -16,33 +21,379 @@ os.environ["TFLITE_USE_CUDA"] = "0"             # Prevent GPU probing if install
 # Suppress warnings and logs
 os.environ['YOLO_CONFIG_DIR'] = '/tmp/Ultralytics'
 os.environ['YOLO_VERBOSE'] = 'False'
-LOGGER.setLevel(logging.ERROR)
-#LOGGER.setLevel(logging.WARNING)  # or logging.ERROR to suppress more
 logging.basicConfig(stream=sys.stderr, level=logging.ERROR)
+
+# Uptime and cold/warm are reported per request; this module is imported at
+# process start, before the model loads
+process_start = time.monotonic()
+served = itertools.count()
+
+# Warmup runs before the function reports ready, on a synthetic frame with the
+# size the cameras send (WIDTHxHEIGHT)
+WARMUP_ITERATIONS = int(os.getenv("warmup_iterations", "3"))
+WARMUP_SIZE = os.getenv("warmup_size", "640x640")
+TFLITE_THREADS = int(os.getenv("tflite_threads", "0")) or None
+# Count straight from the raw output tensor instead of building ultralytics
+# Results objects; "postprocess": "full" in a request selects the old path
+COUNT_ONLY = os.getenv("count_only", "true").lower() == "true"
+# Low-memory mode for the Raspberry Pi: at most max_frames full-resolution
+# frames are decoded at once and only one resolution's preprocessing buffers
+# are kept
+LOW_MEMORY = os.getenv("low_memory", "false").lower() == "true"
+MAX_FRAMES = int(os.getenv("max_frames", "1" if LOW_MEMORY else "0"))
+# Exports of the model at smaller input sizes (comma separated paths) that
+# requests with a "deadline_ms" latency budget can be run on; requests
+# without one, or without a default deadline_ms, use the main model
+TFLITE_MODELS = [path.strip() for path in os.getenv("tflite_models", "").split(",") if path.strip()]
+DEADLINE_MS = float(os.getenv("deadline_ms", "0")) or None
+# Unix socket of the node's model server. With one, the exports are loaded and
+# invoked there, queued with the other replicas' frames, and this process
+# holds no interpreter
+MODEL_SERVER = os.getenv("model_server", "")
+# "priority" in a request; live frames reach the model before batch ones
+PRIORITIES = ("live", "batch")
+
+def load_interpreter(path, num_threads=None):
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    interpreter = Interpreter(model_path=path, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    return interpreter
+
+class Export:
+    """One exported model file with its own interpreter, or its model server connection."""
+
+    def __init__(self, path):
+        self.path = path
+        if MODEL_SERVER:
+            # The server loads the file itself, so it needs the same path
+            self.remote = ModelClient(MODEL_SERVER, os.path.abspath(path))
+            self.input_h, self.input_w = self.remote.info["input_shape"]
+            return
+        self.remote = None
+        self.interpreter = load_interpreter(path, TFLITE_THREADS)
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        _, self.input_h, self.input_w, _ = (int(v) for v in self.input_detail["shape"])
+
+    def inputs(self):
+        """The NHWC buffer the next frame is normalized into."""
+        if self.remote is not None:
+            return self.remote.inputs((1, self.input_h, self.input_w, 3))
+        return self.interpreter.tensor(self.input_detail["index"])()
+
+    def invoke(self):
+        """Run the frame in inputs() and return the raw output."""
+        if self.remote is not None:
+            return self.remote.infer(self.inputs())[0]
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_detail["index"])
+
+class Model:
+    """The main export and its smaller-input variants, with their own
+    preprocessing buffers and latency model.
+
+    Jobs keep the Model they started on, so swapping in a new one only
+    affects requests that arrive afterwards.
+    """
+
+    def __init__(self, path, extra_paths=()):
+        start = time.perf_counter()
+        self.path = path
+        main = Export(path)
+        self.exports = {main.input_h: main}
+        for extra in extra_paths:
+            export = Export(extra)
+            self.exports.setdefault(export.input_h, export)
+        self.points = OperatingPoints(self.exports, main.input_h)
+        # Frames are letterboxed into pooled canvases on the decode threads and
+        # normalized straight into the interpreter's NHWC input tensor right
+        # before invoke(), instead of going through the ultralytics predictor
+        self.preprocess = Preprocessor(main.input_h, auto=False, layout="nhwc",
+                                       max_resolutions=(1 if LOW_MEMORY else 4) * len(self.exports))
+        self.load_seconds = time.perf_counter() - start
+
 # Load model once (avoid reloading on every request)
 #model_path = "/home/app/function/yolov8n_saved_model/yolov8n_float16.tflite"
 model_path = "/home/app/function/tflitey8/yolov8n_float16.tflite"
-model = YOLO(model_path, task="detect")  # Load the YOLO model
+current = Model(model_path, TFLITE_MODELS)
+model_load_seconds = current.load_seconds
+# The exported model has a fixed batch of one frame
+max_batch = 1
 
-def handle(req):
+# Without the runtime's pipeline, handle() calls take turns on the interpreter
+model_lock = threading.Lock()
+swap_lock = threading.Lock()
+frame_slots = threading.BoundedSemaphore(MAX_FRAMES) if MAX_FRAMES else None
+
+class Job:
+    """One request on its way through prepare(), infer() and finish()."""
+
+    def __init__(self, cold, model=None):
+        self.start = time.perf_counter()
+        self.cold = cold
+        self.model = model or current
+        self.deadline = None
+        self.priority = PRIORITIES[0]
+        self.imgsz = None
+        self.cost = 0
+        self.predicted = None
+        self.timings = {}
+        self.error = None
+        self.count_only = COUNT_ONLY
+        self.img = None  # only kept for the full postprocessing path
+        self.canvas = None
+        self.input_shape = None
+        self.preds = None
+        self.queued = None
+        self.decode_scale = 1
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+def load(job, img, shape=None, imgsz=None):
+    # Grayscale frames are expanded to BGR inside the preprocessing buffers
+    start = time.perf_counter()
+    if imgsz is None:
+        job.imgsz, job.cost, job.predicted = job.model.points.choose(job.deadline, (start - job.start) * 1000)
+    else:
+        job.imgsz = imgsz
+    job.canvas = job.model.preprocess.letterbox(img, shape, job.imgsz)
+    job.input_shape = job.canvas.image.shape[:2]
+    if not job.count_only:
+        job.img = img
+    job.timings["preprocess"] = elapsed_ms(start)
+    job.queued = time.perf_counter()
+
+def decode(job, img_data, fmt):
+    """The frame and, if it was decoded at a reduced size, its full-resolution shape."""
+    if fmt == "pickle":
+        return pickle.loads(img_data), None
+    # Encoded images (JPEG, PNG) are decoded at the smallest scale that still
+    # covers the model input; the full postprocessing path hands the frame to
+    # ultralytics Results, so it keeps the full resolution
+    img, shape, job.decode_scale = decode_image(img_data, job.model.points.sizes[0] if job.count_only else None)
+    return img, shape
+
+def prepare(req):
+    """Parse, decode and letterbox a request; runs on the runtime's decode threads."""
+    # Only the first request this process serves is cold
+    job = Job(next(served) == 0)
     try:
+        start = time.perf_counter()
         data = json.loads(req)
-        img_data = base64.b64decode(data["image_data"]["image"])
-        img = pickle.loads(img_data)
-        if len(img.shape) == 2:  # Grayscale
-            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        job.timings["parse"] = elapsed_ms(start)
+        job.count_only = data.get("postprocess", "count" if COUNT_ONLY else "full") == "count"
+        deadline = data.get("deadline_ms", DEADLINE_MS)
+        job.deadline = float(deadline) if deadline is not None else None
+        job.priority = data.get("priority", PRIORITIES[0])
+        if job.priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {job.priority!r}, expected one of {', '.join(PRIORITIES)}")
+
+        if frame_slots is not None:
+            start = time.perf_counter()
+            frame_slots.acquire()
+            job.timings["queue"] = elapsed_ms(start)
+        try:
+            start = time.perf_counter()
+            # Drop each intermediate as soon as the next one exists
+            image_data = data.pop("image_data")
+            del data
+            img_data = base64.b64decode(image_data.pop("image"))
+            img, shape = decode(job, img_data, image_data.get("format", "pickle"))
+            del img_data
+            job.timings["decode"] = elapsed_ms(start)
+
+            # Only the letterboxed canvas waits for the interpreter
+            load(job, img, shape)
+            del img
+        finally:
+            if frame_slots is not None:
+                frame_slots.release()
+    except Exception as e:
+        job.error = e
+        job.model.points.done(job.cost)
+    return job
+
+def infer(jobs):
+    """Run the interpreter on prepared jobs and return the batch size of each invoke().
+
+    Only one thread at a time calls this.
+    """
+    sizes = []
+    now = time.perf_counter()
+    for job in jobs:
+        if job.error is not None:
+            continue
+        job.timings["queue"] = round(job.timings.get("queue", 0) + (now - job.queued) * 1000, 3)
+
+        model = job.model
+        # Whatever fails, the job leaves the latency model's backlog and gives
+        # its canvas back; a failed job fails only itself
+        try:
+            export = model.exports[job.imgsz]
+            start = time.perf_counter()
+            # The view on the input tensor must be gone before invoke()
+            model.preprocess.normalize([job.canvas], out=export.inputs())
+            model.preprocess.release(job.canvas)
+            job.canvas = None
+            job.timings["preprocess"] = round(job.timings["preprocess"] + elapsed_ms(start), 3)
+
+            start = time.perf_counter()
+            job.preds = export.invoke()
+            job.timings["inference"] = elapsed_ms(start)
+        except Exception as e:
+            job.error = e
+            continue
+        finally:
+            if job.canvas is not None:
+                model.preprocess.release(job.canvas)
+                job.canvas = None
+            model.points.done(job.cost)
+            now = time.perf_counter()
+        model.points.observe(job.imgsz, job.timings["inference"])
+        sizes.append(1)
+    return sizes
+
+def finish(job):
+    """Count the people in an inferred job and build the response."""
+    try:
+        if job.error is not None:
+            raise job.error
 
         # Detect only people (class 0)
-        results = model(img, classes=[0], conf=0.5, verbose=False)
-        count = sum(len(result.boxes) for result in results)
+        start = time.perf_counter()
+        preds = job.preds
+        export = job.model.exports[job.imgsz]
+        # Exported boxes are normalized, scale them back to input pixels
+        preds[:, [0, 2]] *= export.input_w
+        preds[:, [1, 3]] *= export.input_h
+        if job.count_only:
+            count = count_people(preds, conf_thres=0.5, iou_thres=0.7)[0]
+        else:
+            count = full_count(preds, job.img, job.input_shape)
+        job.timings["postprocess"] = elapsed_ms(start)
 
-        return json.dumps({
+        return respond({
             "status": "success",
-            "count": count
-        })
-    
+            "count": count,
+            "postprocess": "count" if job.count_only else "full",
+            "decode_scale": job.decode_scale,
+            **operating_point(job)
+        }, job.timings, job.cold, job.priority)
+
     except Exception as e:
         return json.dumps({
             "status": "error",
             "message": str(e)
         })
+
+def operating_point(job):
+    point = {"imgsz": job.imgsz, "model": os.path.basename(job.model.exports[job.imgsz].path)}
+    if job.deadline is not None:
+        point.update({"deadline_ms": job.deadline, "predicted_ms": job.predicted})
+    return point
+
+def full_count(preds, img, input_shape):
+    # torch and ultralytics are only needed here, so the count-only path never
+    # loads them (several hundred MB on the Pi)
+    import torch
+    from ultralytics.utils import LOGGER, ops
+    from ultralytics.engine.results import Results
+    LOGGER.setLevel(logging.ERROR)
+
+    # What the ultralytics predictor does after inference
+    results = []
+    for det in ops.non_max_suppression(torch.from_numpy(preds), conf_thres=0.5, iou_thres=0.7, classes=[0]):
+        det[:, :4] = ops.scale_boxes(input_shape, det[:, :4], img.shape)
+        results.append(Results(img, path="", names={0: "person"}, boxes=det))
+    return sum(len(result.boxes) for result in results)
+
+def warm(model, iterations):
+    """Run iterations frames through each of model's exports; returns seconds."""
+    # First invocations pay for XNNPACK weight packing and graph initialization
+    width, height = (int(v) for v in WARMUP_SIZE.lower().split("x"))
+    frame = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    # The last run of each export seeds the latency model
+    for imgsz in model.points.sizes:
+        for _ in range(iterations):
+            job = Job(cold=False, model=model)
+            load(job, frame, imgsz=imgsz)
+            infer([job])
+            # infer() leaves a failed job's error on it; a model that can't
+            # run must not report ready or be swapped in
+            if job.error is not None:
+                raise job.error
+            finish(job)
+        if iterations:
+            model.points.seed(imgsz, job.timings["inference"])
+    return time.perf_counter() - start
+
+def warmup(iterations=WARMUP_ITERATIONS):
+    return {
+        "model_load_seconds": round(model_load_seconds, 4),
+        "warmup_iterations": iterations,
+        "warmup_seconds": round(warm(current, iterations), 4)
+    }
+
+def swap(path, extra_paths=None):
+    """Load the export at path, warm it up and switch new requests over to it.
+
+    The smaller-input exports in tflite_models stay unless extra_paths
+    replaces them. Runs next to the model in use (whose memory stays
+    allocated until its last request finishes); requests already in flight
+    finish on the model they started on.
+    """
+    global current
+    with swap_lock:
+        start = time.perf_counter()
+        model = Model(path, TFLITE_MODELS if extra_paths is None else extra_paths)
+        warmup_seconds = warm(model, WARMUP_ITERATIONS)
+        previous, current = current, model
+        return {
+            "model": path,
+            "previous_model": previous.path,
+            "load_seconds": round(model.load_seconds, 4),
+            "warmup_seconds": round(warmup_seconds, 4),
+            "swap_seconds": round(time.perf_counter() - start, 4)
+        }
+
+def stats():
+    model = current
+    return {**model.preprocess.stats(), **model.points.stats()}
+
+def respond(result, timings, cold, priority):
+    result.update({
+        "priority": priority,
+        "timings": timings,
+        "uptime_seconds": round(time.monotonic() - process_start, 3),
+        "cold_start": cold
+    })
+    # The body is a few hundred bytes, serializing it a second time so it can
+    # carry its own serialize time costs microseconds
+    start = time.perf_counter()
+    json.dumps(result)
+    timings["serialize"] = elapsed_ms(start)
+    return {
+        "statusCode": 200,
+        "body": json.dumps(result),
+        "headers": {
+            "Server-Timing": ", ".join(f"{phase};dur={ms}" for phase, ms in timings.items()),
+            "X-Uptime-Seconds": result["uptime_seconds"],
+            "X-Cold-Start": str(cold).lower(),
+            "X-Priority": priority
+        }
+    }
+
+def handle(req):
+    job = prepare(req)
+    with model_lock:
+        infer([job])
+    return finish(job)
@@ -0,0 +1,67 @@
+import json
+import socket
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+def attach(name):
+    segment = shared_memory.SharedMemory(name=name)
+    # Before Python 3.13 attaching registers the segment with this process's
+    # resource tracker, which would unlink the server's segment when we exit
+    resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+class ModelClient:
+    """Connection to the node's model server for one model.
+
+    Frames are normalized straight into a shared-memory segment the server
+    maps; the raw model output comes back through a segment the server owns
+    for this connection. One call at a time per client.
+    """
+
+    def __init__(self, address, model):
+        self.model = model
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(address)
+        self.reader = self.sock.makefile("rb")
+        self.segment = None
+        self.output = None
+        self.info = self.call({"op": "load", "model": model})
+
+    def call(self, message):
+        self.sock.sendall(json.dumps(message).encode() + b"\n")
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Model server closed the connection")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(f"Model server: {reply['error']}")
+        return reply
+
+    def inputs(self, shape):
+        """A float32 array of the given shape in the shared input segment."""
+        size = int(np.prod(shape)) * 4
+        if self.segment is None or self.segment.size < size:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment.unlink()
+            self.segment = shared_memory.SharedMemory(create=True, size=size)
+        return np.ndarray(shape, dtype=np.float32, buffer=self.segment.buf)
+
+    def infer(self, inputs):
+        """Run the frames written into inputs(); returns (output, server batch size)."""
+        reply = self.call({"op": "infer", "model": self.model, "shm": self.segment.name, "shape": list(inputs.shape)})
+        if self.output is None or self.output.name != reply["shm"]:
+            if self.output is not None:
+                self.output.close()
+            self.output = attach(reply["shm"])
+        output = np.ndarray(reply["shape"], dtype=np.float32, buffer=self.output.buf).copy()
+        return output, reply["batch"]
+
+    def __del__(self):
+        # A swapped-out model's client goes away with its last job
+        if getattr(self, "segment", None) is not None:
+            try:
+                self.segment.close()
+                self.segment.unlink()
+            except (BufferError, FileNotFoundError):
+                pass
@@ -0,0 +1,43 @@
+import numpy as np
+
+def count_people(preds, conf_thres=0.5, iou_thres=0.7, max_det=300, max_nms=30000):
+    """Count person detections in raw YOLO output without building Results.
+
+    preds is the (batch, 4 + classes, anchors) head output with xywh boxes.
+    A box counts when person (class 0) is its best class and scores above
+    conf_thres, then greedy NMS is applied, which gives the same number as
+    ultralytics' non_max_suppression(classes=[0]).
+    """
+    if isinstance(preds, (list, tuple)):
+        preds = preds[0]
+    if hasattr(preds, "numpy"):
+        preds = preds.numpy()
+    return [count_image(x, conf_thres, iou_thres, max_det, max_nms) for x in preds]
+
+def count_image(x, conf_thres, iou_thres, max_det, max_nms):
+    # Cheap person-score threshold first, the arg max over all classes only
+    # for the few anchors that pass it
+    candidates = np.flatnonzero(x[4] > conf_thres)
+    if candidates.size == 0:
+        return 0
+    candidates = candidates[x[4:, candidates].argmax(0) == 0]
+    if candidates.size == 0:
+        return 0
+
+    scores = x[4, candidates]
+    order = np.argsort(-scores, kind="stable")[:max_nms]
+    cx, cy, w, h = x[:4, candidates[order]]
+    x1, y1, x2, y2 = cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2
+    areas = (x2 - x1) * (y2 - y1)
+
+    count = 0
+    remaining = np.arange(order.size)
+    while remaining.size and count < max_det:
+        i, rest = remaining[0], remaining[1:]
+        count += 1
+        iw = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        ih = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = iw * ih
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        remaining = rest[iou <= iou_thres]
+    return count
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+import threading
+import cv2
+import numpy as np
+
+# Same padding colour as ultralytics' LetterBox
+PAD_VALUE = 114
+
+class Canvas:
+    """One letterboxed frame. Its border is drawn once and kept between uses."""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.image = plan.alloc(np.full, plan.shape, PAD_VALUE)
+        self.roi = self.image[plan.top:plan.top + plan.new_h, plan.left:plan.left + plan.new_w]
+        # Grayscale frames are resized first and expanded to BGR afterwards,
+        # which converts fewer pixels than GRAY2BGR on the full frame
+        self.gray = plan.alloc(np.empty, (plan.new_h, plan.new_w)) if plan.gray else None
+
+    def fill(self, img):
+        plan = self.plan
+        size = (plan.new_w, plan.new_h)
+        if img.ndim == 2:
+            if plan.resize:
+                into(self.gray, cv2.resize(img, size, dst=self.gray, interpolation=cv2.INTER_LINEAR))
+                into(self.roi, cv2.cvtColor(self.gray, cv2.COLOR_GRAY2BGR, dst=self.roi))
+            else:
+                into(self.roi, cv2.cvtColor(img, cv2.COLOR_GRAY2BGR, dst=self.roi))
+        elif plan.resize:
+            into(self.roi, cv2.resize(img, size, dst=self.roi, interpolation=cv2.INTER_LINEAR))
+        else:
+            np.copyto(self.roi, img)
+
+class Letterbox:
+    """Letterbox geometry for one input resolution and the buffers reused for it.
+
+    Canvases are pooled, so a frame can be letterboxed while earlier frames of
+    the same resolution still wait for the model. The pool only grows to the
+    number of frames in flight at once.
+    """
+
+    def __init__(self, shape, imgsz, stride=32, auto=False, layout="nchw"):
+        h, w = shape[:2]
+        self.ratio = min(imgsz / h, imgsz / w)
+        self.new_w, self.new_h = int(round(w * self.ratio)), int(round(h * self.ratio))
+        dw, dh = imgsz - self.new_w, imgsz - self.new_h
+        if auto:  # minimum rectangle, as the predictor does for .pt models
+            dw, dh = dw % stride, dh % stride
+        self.top, self.left = int(round(dh / 2 - 0.1)), int(round(dw / 2 - 0.1))
+        self.shape = (self.new_h + dh, self.new_w + dw, 3)
+        self.resize = (h, w) != (self.new_h, self.new_w)
+        self.gray = len(shape) == 2 and self.resize
+        self.layout = layout
+        self.allocations = 0
+        self.free = []
+        # Normalized model input with one row per batched frame, only allocated
+        # when the caller doesn't write into a buffer the runtime owns (the
+        # TFLite interpreter's input tensor)
+        self.input = None
+
+    def alloc(self, fn, shape, *args, dtype=np.uint8):
+        self.allocations += 1
+        return fn(shape, *args, dtype=dtype)
+
+    def inputs(self, rows):
+        if self.input is None or self.input.shape[0] < rows:
+            height, width = self.shape[:2]
+            shape = (rows, 3, height, width) if self.layout == "nchw" else (rows, height, width, 3)
+            self.input = self.alloc(np.empty, shape, dtype=np.float32)
+        return self.input[:rows]
+
+def into(dst, result):
+    # cv2 writes straight into dst when it can wrap it, otherwise copy its output
+    if not np.shares_memory(result, dst):
+        np.copyto(dst, result)
+
+class Preprocessor:
+    """Letterbox, BGR->RGB and 0-1 normalization into a model input buffer.
+
+    Buffers are kept per input resolution and model input size (most
+    recently used first), so a stream of same-sized camera frames allocates
+    nothing once the pipeline is full. letterbox() may run on several threads at once; normalize() writes
+    the model input and belongs to whichever thread runs the model.
+    """
+
+    def __init__(self, imgsz, stride=32, auto=False, layout="nchw", max_resolutions=4):
+        self.imgsz = imgsz
+        self.stride = stride
+        self.auto = auto
+        self.layout = layout
+        self.max_resolutions = max_resolutions
+        self.lock = threading.Lock()
+        self.plans = OrderedDict()
+        self.allocations = 0
+        self.hits = 0
+        self.misses = 0
+
+    def plan(self, shape, imgsz):
+        key = (shape, imgsz)
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = Letterbox(shape, imgsz, self.stride, self.auto, self.layout)
+            self.plans[key] = plan
+            if len(self.plans) > self.max_resolutions:
+                self.plans.popitem(last=False)
+        else:
+            self.plans.move_to_end(key)
+        return plan
+
+    def letterbox(self, img, shape=None, imgsz=None):
+        """Letterbox img into a pooled canvas, to be handed back with release().
+
+        shape is the frame's full-resolution (height, width) when img was
+        decoded at a reduced size; the letterbox geometry follows it. imgsz
+        overrides the model input size.
+        """
+        if img.ndim == 3 and img.shape[2] == 1:
+            img = img[..., 0]
+        key = img.shape if shape is None else tuple(shape) + img.shape[2:]
+        with self.lock:
+            plan = self.plan(key, imgsz or self.imgsz)
+            if plan.free:
+                canvas = plan.free.pop()
+                self.hits += 1
+            else:
+                before = plan.allocations
+                canvas = Canvas(plan)
+                self.allocations += plan.allocations - before
+                self.misses += 1
+        canvas.fill(img)
+        return canvas
+
+    def normalize(self, canvases, out=None):
+        """Write the canvases, one per row, into out or their resolution's input buffer."""
+        if out is None:
+            plan = canvases[0].plan
+            with self.lock:
+                before = plan.allocations
+                out = plan.inputs(len(canvases))
+                self.allocations += plan.allocations - before
+        for row, canvas in zip(out, canvases):
+            rgb = canvas.image[..., ::-1]
+            if self.layout == "nchw":
+                rgb = rgb.transpose(2, 0, 1)
+            np.multiply(rgb, 1 / 255, out=row, dtype=np.float32)
+        return out
+
+    def release(self, canvas):
+        with self.lock:
+            canvas.plan.free.append(canvas)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "buffer_allocations_total": self.allocations,
+            "buffer_cache_hits_total": self.hits,
+            "buffer_cache_misses_total": self.misses,
+            "buffer_cache_hit_ratio": round(self.hits / lookups, 4) if lookups else 0,
+            "cached_resolutions": len(self.plans)
+        }
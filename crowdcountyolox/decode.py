@@ -0,0 +1,58 @@
+import os
+import cv2
+import numpy as np
+
+# JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg's DCT scaling when
+# the frame would be shrunk to the model input anyway
+REDUCED_DECODE = os.getenv("reduced_decode", "true").lower() == "true"
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# Start-of-frame markers carry the image size; C4, C8 and CC are other segments
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def jpeg_size(buf):
+    """(height, width) from a JPEG's start-of-frame segment, or None."""
+    if buf[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(buf):
+        if buf[i] != 0xFF:
+            return None
+        marker = buf[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in SOF_MARKERS:
+            return int.from_bytes(buf[i + 5:i + 7], "big"), int.from_bytes(buf[i + 7:i + 9], "big")
+        i += 2 + int.from_bytes(buf[i + 2:i + 4], "big")
+    return None
+
+def reduction(shape, imgsz):
+    """Largest DCT scale that still leaves at least imgsz pixels on the long side."""
+    longest = max(shape)
+    for factor in (8, 4, 2):
+        if longest / factor >= imgsz:
+            return factor
+    return 1
+
+def decode_image(buf, imgsz):
+    """Decode an encoded image for a model with imgsz input.
+
+    Returns the image, the (height, width) it has at full resolution and the
+    factor it was decoded at. Letterboxing by the full-resolution size keeps the
+    geometry, and so the box mapping, the same as a full decode. With imgsz
+    None the image is always decoded at full resolution.
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    size = jpeg_size(buf) if REDUCED_DECODE and imgsz else None
+    factor = reduction(size, imgsz) if size else 1
+    img = cv2.imdecode(data, REDUCED_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    if factor == 1:
+        return img, img.shape[:2], 1
+    height, width = size
+    # imdecode applies EXIF rotation, which the header size doesn't
+    if (img.shape[0] > img.shape[1]) != (height > width):
+        height, width = width, height
+    return img, (height, width), factor
@@ -1,36 +1,366 @@
-from ultralytics import YOLO
 import pickle
 import json
 import base64
 import os
-from ultralytics.utils import LOGGER
 import logging
+import threading
+import time
+import itertools
+import numpy as np
+from .preprocess import Preprocessor
+from .deadline import OperatingPoints
+from .decode import decode_image
+from .modelclient import ModelClient
+from .postprocess import count_people
 
-# Suppress warnings and logs
-os.environ['YOLO_CONFIG_DIR'] = '/tmp/Ultralytics'
-os.environ['YOLO_VERBOSE'] = 'False'
-LOGGER.setLevel(logging.ERROR)
+# Unix socket of the node's model server. With one, the network runs there,
+# batched with the other replicas' frames, and this process only decodes,
+# letterboxes and counts; torch and ultralytics are only imported if a request
+# asks for the full postprocessing path
+MODEL_SERVER = os.getenv("model_server", "")
+# Where the model files are (/home/app/function in the image)
+FUNCTION_DIR = os.path.dirname(os.path.abspath(__file__))
+
+if not MODEL_SERVER:
+    # Suppress warnings and logs
+    os.environ['YOLO_CONFIG_DIR'] = '/tmp/Ultralytics'
+    os.environ['YOLO_VERBOSE'] = 'False'
+    import torch
+    from ultralytics import YOLO
+    from ultralytics.utils import LOGGER
+    LOGGER.setLevel(logging.ERROR)
+
+# Uptime and cold/warm are reported per request; this module is imported at
+# process start, before the model loads
+process_start = time.monotonic()
+served = itertools.count()
+
+# Warmup runs before the function reports ready, on a synthetic frame with the
+# size the cameras send (WIDTHxHEIGHT)
+WARMUP_ITERATIONS = int(os.getenv("warmup_iterations", "3"))
+WARMUP_SIZE = os.getenv("warmup_size", "640x640")
+IMGSZ = int(os.getenv("imgsz", "640"))
+# Count straight from the raw head output instead of building ultralytics
+# Results objects; "postprocess": "full" in a request selects the old path
+COUNT_ONLY = os.getenv("count_only", "true").lower() == "true"
+# Smaller input sizes (multiples of 32) that requests with a "deadline_ms"
+# latency budget can be run at; requests without one, or without a default
+# deadline_ms, run at imgsz
+IMGSZ_OPTIONS = [int(v) for v in os.getenv("imgsz_options", str(IMGSZ)).split(",") if v.strip()]
+DEADLINE_MS = float(os.getenv("deadline_ms", "0")) or None
+# "priority" in a request; live frames reach the model before batch ones
+PRIORITIES = ("live", "batch")
+
+class Model:
+    """A loaded network with its own preprocessing buffers and latency model.
+
+    Jobs keep the Model they started on, so swapping in a new one only
+    affects requests that arrive afterwards.
+    """
+
+    def __init__(self, path):
+        start = time.perf_counter()
+        # Relative paths are inside the function's directory, whatever the
+        # watchdog's working directory; the model server gets the same path
+        path = os.path.join(FUNCTION_DIR, path)
+        self.path = path
+        if MODEL_SERVER:
+            # The server loads the file itself, so it needs the same path
+            self.remote = ModelClient(MODEL_SERVER, path)
+            self.names = {int(k): v for k, v in self.remote.info["names"].items()}
+            stride = self.remote.info["stride"]
+        else:
+            self.remote = None
+            yolo = YOLO(path)
+            yolo.fuse()
+            self.net = yolo.model.eval()
+            self.names = yolo.names
+            stride = max(int(self.net.stride.max()), 32)
+        # Letterboxed frames are padded to the stride, so any other size
+        # would run at a different resolution than the latency model expects
+        bad = sorted(size for size in {IMGSZ, *IMGSZ_OPTIONS} if size <= 0 or size % stride)
+        if bad:
+            raise ValueError(f"imgsz and imgsz_options must be positive multiples of the model stride ({stride}), "
+                             f"got {', '.join(map(str, bad))}")
+        # Frames are letterboxed straight into pooled canvases and normalized
+        # into per-resolution input tensors (or the model server's shared
+        # memory), so the predictor's own preprocessing is skipped
+        self.points = OperatingPoints(IMGSZ_OPTIONS, IMGSZ)
+        self.preprocess = Preprocessor(IMGSZ, stride=stride, auto=True, layout="nchw",
+                                       max_resolutions=4 * len(self.points.sizes))
+        self.load_seconds = time.perf_counter() - start
 
 # Load model once (avoid reloading on every request)
-model = YOLO("./yolo11x.pt")
+current = Model("yolo11x.pt")
+model_load_seconds = current.load_seconds
+# Frames with the same letterboxed shape that are queued together go through
+# the network as one batch
+max_batch = int(os.getenv("max_batch", "4"))
+# Without the runtime's pipeline, handle() calls take turns on the network
+model_lock = threading.Lock()
+swap_lock = threading.Lock()
 
-def handle(req):
+class Job:
+    """One request on its way through prepare(), infer() and finish()."""
+
+    def __init__(self, cold, model=None):
+        self.start = time.perf_counter()
+        self.cold = cold
+        self.model = model or current
+        self.deadline = None
+        self.priority = PRIORITIES[0]
+        self.imgsz = None
+        self.cost = 0
+        self.predicted = None
+        self.timings = {}
+        self.error = None
+        self.count_only = COUNT_ONLY
+        self.img = None  # only kept for the full postprocessing path
+        self.canvas = None
+        self.input_shape = None
+        self.preds = None
+        self.queued = None
+        self.decode_scale = 1
+        self.batch_size = 1
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+def load(job, img, shape=None, imgsz=None):
+    start = time.perf_counter()
+    if imgsz is None:
+        job.imgsz, job.cost, job.predicted = job.model.points.choose(job.deadline, (start - job.start) * 1000)
+    else:
+        job.imgsz = imgsz
+    job.canvas = job.model.preprocess.letterbox(img, shape, job.imgsz)
+    job.input_shape = job.canvas.image.shape[:2]
+    if not job.count_only:
+        job.img = img
+    job.timings["preprocess"] = elapsed_ms(start)
+    job.queued = time.perf_counter()
+
+def decode(job, img_data, fmt):
+    """The frame and, if it was decoded at a reduced size, its full-resolution shape."""
+    if fmt == "pickle":
+        return pickle.loads(img_data), None
+    # Encoded images (JPEG, PNG) are decoded at the smallest scale that still
+    # covers the model input; the full postprocessing path hands the frame to
+    # ultralytics Results, so it keeps the full resolution
+    img, shape, job.decode_scale = decode_image(img_data, job.model.points.sizes[0] if job.count_only else None)
+    return img, shape
+
+def prepare(req):
+    """Parse, decode and letterbox a request; runs on the runtime's decode threads."""
+    # Only the first request this process serves is cold
+    job = Job(next(served) == 0)
     try:
+        start = time.perf_counter()
         data = json.loads(req)
+        job.timings["parse"] = elapsed_ms(start)
+        job.count_only = data.get("postprocess", "count" if COUNT_ONLY else "full") == "count"
+        deadline = data.get("deadline_ms", DEADLINE_MS)
+        job.deadline = float(deadline) if deadline is not None else None
+        job.priority = data.get("priority", PRIORITIES[0])
+        if job.priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {job.priority!r}, expected one of {', '.join(PRIORITIES)}")
+
+        start = time.perf_counter()
         img_data = base64.b64decode(data["image_data"]["image"])
-        img = pickle.loads(img_data)
+        img, shape = decode(job, img_data, data["image_data"].get("format", "pickle"))
+        job.timings["decode"] = elapsed_ms(start)
+
+        load(job, img, shape)
+    except Exception as e:
+        job.error = e
+        job.model.points.done(job.cost)
+    return job
+
+def infer(jobs):
+    """Run the network on prepared jobs and return the batch size of each forward pass.
+
+    Only one thread at a time calls this.
+    """
+    now = time.perf_counter()
+    groups = {}
+    for job in jobs:
+        if job.error is None:
+            job.timings["queue"] = round((now - job.queued) * 1000, 3)
+            groups.setdefault((job.model, job.imgsz, job.input_shape), []).append(job)
+
+    sizes = []
+    for (model, imgsz, _), group in groups.items():
+        # Whatever fails, every job leaves the latency model's backlog and
+        # gives its canvas back; a failed group fails only its own jobs
+        try:
+            start = time.perf_counter()
+            out = model.remote.inputs((len(group), 3, *group[0].input_shape)) if model.remote else None
+            batch = model.preprocess.normalize([job.canvas for job in group], out)
+            release(model, group)
+            normalize_ms = elapsed_ms(start)
+
+            start = time.perf_counter()
+            preds, batch_size = forward(model, batch)
+            inference_ms = elapsed_ms(start)
+        except Exception as e:
+            for job in group:
+                job.error = e
+            continue
+        finally:
+            release(model, group)
+            for job in group:
+                model.points.done(job.cost)
+
+        model.points.observe(imgsz, inference_ms / len(group))
+        for i, job in enumerate(group):
+            job.preds = preds[i:i + 1]
+            job.timings["preprocess"] = round(job.timings["preprocess"] + normalize_ms, 3)
+            job.timings["inference"] = inference_ms
+            job.batch_size = batch_size
+        sizes.append(len(group))
+    return sizes
+
+def release(model, group):
+    for job in group:
+        if job.canvas is not None:
+            model.preprocess.release(job.canvas)
+            job.canvas = None
+
+def forward(model, batch):
+    """Raw head output for a normalized batch and the batch size it ran at.
+
+    On the model server the frames may share a forward pass with other
+    replicas' frames, so the batch size can be larger than the group.
+    """
+    if model.remote is not None:
+        return model.remote.infer(batch)
+    with torch.inference_mode():
+        preds = model.net(torch.from_numpy(batch))
+    return (preds[0] if isinstance(preds, (list, tuple)) else preds), len(batch)
+
+def finish(job):
+    """Count the people in an inferred job and build the response."""
+    try:
+        if job.error is not None:
+            raise job.error
 
         # Detect only people (class 0)
-        results = model(img, classes=[0], conf=0.5, verbose=False)
-        count = sum(len(result.boxes) for result in results)
+        start = time.perf_counter()
+        if job.count_only:
+            count = count_people(job.preds, conf_thres=0.5, iou_thres=0.7)[0]
+        else:
+            count = full_count(job.preds, job.img, job.input_shape, job.model.names)
+        job.timings["postprocess"] = elapsed_ms(start)
 
-        return json.dumps({
+        return respond({
             "status": "success",
-            "count": count
-        })
-    
+            "count": count,
+            "postprocess": "count" if job.count_only else "full",
+            "decode_scale": job.decode_scale,
+            "batch_size": job.batch_size,
+            **operating_point(job)
+        }, job.timings, job.cold, job.priority)
+
     except Exception as e:
         return json.dumps({
             "status": "error",
             "message": str(e)
         })
+
+def operating_point(job):
+    point = {"imgsz": job.imgsz, "model": os.path.basename(job.model.path)}
+    if job.deadline is not None:
+        point.update({"deadline_ms": job.deadline, "predicted_ms": job.predicted})
+    return point
+
+def full_count(preds, img, input_shape, names):
+    # What the ultralytics predictor does after inference
+    import torch
+    from ultralytics.utils import ops
+    from ultralytics.engine.results import Results
+    if isinstance(preds, np.ndarray):  # from the model server
+        preds = torch.from_numpy(preds)
+    results = []
+    for det in ops.non_max_suppression(preds, conf_thres=0.5, iou_thres=0.7, classes=[0]):
+        det[:, :4] = ops.scale_boxes(input_shape, det[:, :4], img.shape)
+        results.append(Results(img, path="", names=names, boxes=det))
+    return sum(len(result.boxes) for result in results)
+
+def warm(model, iterations):
+    """Run iterations frames through model at each input size; returns seconds."""
+    width, height = (int(v) for v in WARMUP_SIZE.lower().split("x"))
+    frame = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    # The last run at each input size seeds the latency model
+    for imgsz in model.points.sizes:
+        for _ in range(iterations):
+            job = Job(cold=False, model=model)
+            load(job, frame, imgsz=imgsz)
+            infer([job])
+            # infer() leaves a failed group's error on its jobs; a model that
+            # can't run must not report ready or be swapped in
+            if job.error is not None:
+                raise job.error
+            finish(job)
+        if iterations:
+            model.points.seed(imgsz, job.timings["inference"])
+    return time.perf_counter() - start
+
+def warmup(iterations=WARMUP_ITERATIONS):
+    return {
+        "model_load_seconds": round(model_load_seconds, 4),
+        "warmup_iterations": iterations,
+        "warmup_seconds": round(warm(current, iterations), 4)
+    }
+
+def swap(path):
+    """Load the model at path, warm it up and switch new requests over to it.
+
+    Runs next to the model in use; requests already in flight finish on the
+    model they started on.
+    """
+    global current
+    with swap_lock:
+        start = time.perf_counter()
+        model = Model(path)
+        warmup_seconds = warm(model, WARMUP_ITERATIONS)
+        previous, current = current, model
+        return {
+            "model": path,
+            "previous_model": previous.path,
+            "load_seconds": round(model.load_seconds, 4),
+            "warmup_seconds": round(warmup_seconds, 4),
+            "swap_seconds": round(time.perf_counter() - start, 4)
+        }
+
+def stats():
+    model = current
+    return {**model.preprocess.stats(), **model.points.stats()}
+
+def respond(result, timings, cold, priority):
+    result.update({
+        "priority": priority,
+        "timings": timings,
+        "uptime_seconds": round(time.monotonic() - process_start, 3),
+        "cold_start": cold
+    })
+    # The body is a few hundred bytes, serializing it a second time so it can
+    # carry its own serialize time costs microseconds
+    start = time.perf_counter()
+    json.dumps(result)
+    timings["serialize"] = elapsed_ms(start)
+    return {
+        "statusCode": 200,
+        "body": json.dumps(result),
+        "headers": {
+            "Server-Timing": ", ".join(f"{phase};dur={ms}" for phase, ms in timings.items()),
+            "X-Uptime-Seconds": result["uptime_seconds"],
+            "X-Cold-Start": str(cold).lower(),
+            "X-Priority": priority
+        }
+    }
+
+def handle(req):
+    job = prepare(req)
+    with model_lock:
+        infer([job])
+    return finish(job)
@@ -0,0 +1,508 @@
+import json
+import subprocess
+import argparse
+import asyncio
+import datetime
+import glob
+import os
+import time
+import numpy as np
+import openpyxl
+import aiohttp
+from dotenv import load_dotenv
+import coldstart
+from client import Gateways, PHASES, basic_auth
+from energy import open_meter
+from histogram import Histogram, PERCENTILES
+from knee import KneeSearch
+from loadgen import Sample, Workers, send_request, run_iteration, run_open_loop, worker_stats
+from payloads import PayloadCache, map_body
+load_dotenv()
+
+# One benchmark for every device, function and load level. Each combination of
+# --targets, --functions and --concurrency runs over the image set in a single
+# sweep, and every request is appended to an xlsx workbook along with a
+# summary per image:
+#
+#   python benchmark.py --targets server,pi --functions crowdcounttflite --concurrency 1,2,3
+#
+# The default closed loop waits for each iteration's requests before sending
+# the next ones. --mode poisson or constant is an open loop instead: requests
+# go out on a fixed schedule at each of --rates, whether or not earlier ones
+# have finished, cycling through the images for --duration seconds. --mode
+# cold makes the function cold before each of --repetitions requests and
+# breaks the time to its first response down (coldstart.py). --knee raises
+# the load until latency passes --slo or throughput stops growing (knee.py)
+# and reports the most throughput the function sustains.
+#
+# Every request has an intended start: its slot in the open-loop schedule, or
+# in the closed loop's --interval pacing. A request that went out late because
+# earlier ones were slow (coordinated omission) has its wait counted in its
+# corrected latency, reported next to the uncorrected one.
+#
+# Requests go through an asyncio client (client.py) with a keep-alive
+# connection pool per gateway, so one process can drive hundreds of requests
+# at once without opening a connection for each. --workers and --agents
+# spread each level over worker processes on this and other hosts
+# (loadgen.py), so the client is never what limits the load. Each request's elapsed time
+# runs to the last byte of the response, and is broken down into the time to
+# get a connection, send the body, wait for the server and read the response,
+# plus the client's time to decode the result.
+#
+# Gateway URLs, login scripts, the image directory and the workbook come from
+# the same .env variables the device scripts used.
+
+# Gateway URL, login script and gateway password variables, and the energy
+# source used by default. The password is only needed to scale functions to
+# zero in cold mode.
+TARGETS = {
+    "server": ("OPENFAAS_URL_SERVER", "LOGIN_SCRIPT_SERVER", "OPENFAAS_PASSWORD_SERVER", "rapl"),
+    "tvbox": ("OPENFAAS_URL_TVBOX", "LOGIN_SCRIPT_TVBOX", "OPENFAAS_PASSWORD_TVBOX", "serial"),
+    "pi": ("OPENFAAS_URL_RASPBERRYPI", "LOGIN_SCRIPT_RASPBERRYPI", "OPENFAAS_PASSWORD_RASPBERRYPI", "serial"),
+}
+# Misspelled names that the older Pi scripts read, still accepted from .env files
+URL_FALLBACKS = {"OPENFAAS_URL_RASPBERRYPI": "OPENFAAS_URL_RASPERRYPI"}
+
+IMAGES = ["0p0f_0.jpg", "0p0f_1.jpg", "0p0f_2.jpg", "0p0f_3.jpg", "0p0f_4.jpg",
+          "1p1f_0.jpg", "1p1f_1.jpg", "1p1f_2.jpg", "1p1f_3.jpg", "1p1f_4.jpg",
+          "2p0f_0.jpg", "2p1f_0.jpg", "2p2f_0.jpg", "2p2f_1.jpg", "2p2f_2.jpg",
+          "3p0f_0.jpg", "3p2f_0.jpg", "3p3f_0.jpg", "3p3f_1.jpg", "3p3f_2.jpg",
+          "4p1f_0.jpg", "4p3f_0.jpg", "4p3f_2.jpg", "4p4f_0.jpg",
+          "5p0f_0.jpg", "5p1f_0.jpg", "6p6f_0.jpg", "8p7f_0.jpg"]
+
+# Load is the concurrency in closed-loop mode and the target rate (requests/s)
+# in the open-loop modes. Start times are seconds since the image (closed
+# loop) or the rate level (open loop) started. The phase columns are seconds
+# from the start of the request; DNS and connect are empty on a reused
+# connection.
+REQUEST_COLUMNS = ["Run", "Device", "Function", "Mode", "Load", "Image", "Iteration", "Request",
+                   "Count", "Elapsed Time (s)", "Energy Iteration (mWh)", "Status",
+                   "Intended Start (s)", "Actual Start (s)", "Corrected Time (s)",
+                   "Queued (s)", "DNS (s)", "Connected (s)", "Request Sent (s)", "First Byte (s)", "Last Byte (s)",
+                   "Decode Time (s)"]
+# Mean time per step of the successful requests
+STEPS = ("queued", "connect", "upload", "server", "download")
+SUMMARY_COLUMNS = ["Run", "Device", "Function", "Mode", "Load", "Image", "Requests", "Errors", "Coalesced",
+                   "Average Time (s)", "Variance", "Std Dev", "Min Time", "Max Time",
+                   "Total Energy (mWh)", "Energy per Request (mWh)", "Throughput (rps)",
+                   "Mean Send Lag (ms)", "Max Send Lag (ms)", *(f"p{p:g} (s)" for p in PERCENTILES),
+                   *(f"Corrected p{p:g} (s)" for p in PERCENTILES),
+                   *(f"Mean {step.capitalize()} (ms)" for step in STEPS), "Mean Decode (ms)"]
+# One row per cold start, with the seconds spent in each of its steps
+COLD_COLUMNS = ["Run", "Device", "Function", "Repetition", "Image", "Status", "Cold",
+                "Time to First Response (s)", "Container Start (s)", "Import (s)", "Model Load (s)",
+                "Warmup (s)", "First Inference (s)", "Other (s)", "Ready Round Trip (s)", "Energy (mWh)"]
+# One row per device and function searched with --knee
+KNEE_COLUMNS = ["Run", "Device", "Function", "Mode", "SLO (s)", "SLO Percentile", "Knee Load",
+                "Max Sustainable Throughput (rps)", "Knee Throughput (rps)", "Knee Latency (s)",
+                "Knee Energy per Request (mWh)", "Levels", "Stopped Because"]
+# CPU used by each process that sent a level's requests, to tell whether the
+# client kept up
+WORKER_COLUMNS = ["Run", "Device", "Function", "Mode", "Load", "Image", "Worker", "Host", "PID", "Requests",
+                  "CPU Time (s)", "Wall Time (s)", "CPU Utilization", "Start Skew (ms)"]
+# A worker busier than this may have held the load back
+BUSY_WORKER = 0.8
+# Fields of a summary row's key, as stored with its latency histogram
+KEY_FIELDS = ("run", "device", "function", "mode", "load", "image")
+
+def gateway_url(variable):
+    """A target's gateway URL from its .env variable, or None if it isn't set."""
+    return os.getenv(variable) or os.getenv(URL_FALLBACKS.get(variable, variable))
+
+def setup_openfaas(login_script):
+    try:
+        with open("/dev/null", "w") as nullfile:
+            subprocess.run(["sudo", "/bin/bash", login_script],
+                         check=True, stdout=nullfile, stderr=nullfile)
+        print("OpenFaaS connection established successfully.")
+        return True
+    except subprocess.CalledProcessError:
+        print("Error: Unable to connect to OpenFaaS server.")
+        return False
+
+def image_paths(directory, images):
+    """Paths for a comma separated list of names or glob patterns in directory."""
+    paths = []
+    for spec in images:
+        matches = sorted(glob.glob(os.path.join(directory, spec)))
+        if not matches:
+            print(f"Error: No image matches {spec} in {directory}")
+        paths.extend(matches)
+    return paths
+
+def schedule(mode, rate, duration, rng):
+    """Intended send times, in seconds from the start, for an open-loop level."""
+    if mode == "constant":
+        return list(np.arange(int(duration * rate)) / rate)
+    # Poisson arrivals: exponentially distributed gaps with mean 1 / rate
+    gaps = rng.exponential(1 / rate, int(duration * rate * 2) + 16)
+    offsets = np.cumsum(gaps) - gaps[0]
+    return list(offsets[offsets < duration])
+
+def setup_workbook(filename):
+    """Loads an existing workbook or creates one with the request and summary sheets."""
+    if os.path.exists(filename):
+        workbook = openpyxl.load_workbook(filename)
+    else:
+        workbook = openpyxl.Workbook()
+        workbook.remove(workbook.active)
+        print(f"Created new workbook: {filename}")
+    for title, columns in (("Requests", REQUEST_COLUMNS), ("Summary", SUMMARY_COLUMNS)):
+        if title not in workbook.sheetnames:
+            workbook.create_sheet(title).append(columns)
+    return workbook
+
+def summarize(key, samples, total_energy, wall_time, histogram, corrected):
+    succeeded = [sample for sample in samples if sample.status == "success"]
+    times = [sample.elapsed for sample in succeeded]
+    steps = [sample.timing.steps() for sample in succeeded]
+    lags = [(sample.sent - sample.intended) * 1000 for sample in samples]
+    row = [*key, len(samples), len(samples) - len(times), sum(sample.coalesced for sample in samples)]
+    if times:
+        row += [np.mean(times), np.var(times), np.std(times), min(times), max(times)]
+    else:
+        row += [None] * 5
+    return row + [total_energy, total_energy / len(samples) if samples else None,
+                  len(times) / wall_time if wall_time else None,
+                  np.mean(lags) if lags else None, max(lags) if lags else None,
+                  *histogram.percentiles().values(), *corrected.percentiles().values(),
+                  *(np.mean([s[step] for s in steps]) * 1000 if steps else None for step in STEPS),
+                  np.mean([sample.decode for sample in succeeded]) * 1000 if succeeded else None]
+
+def sample_row(key, iteration, request, sample, energy):
+    phases = [sample.timing.get(phase) if sample.timing else None for phase in PHASES]
+    return [*key[:5], sample.image, iteration, request, sample.count, sample.elapsed, energy, sample.status,
+            sample.intended, sample.sent, sample.corrected, *phases, sample.decode]
+
+class Report:
+    """The results workbook, plus the latency histogram of every summary row
+    appended to a JSON lines file that histogram.py can merge."""
+
+    def __init__(self, output, histograms):
+        self.output = output
+        self.histograms = histograms
+        self.workbook = setup_workbook(output)
+
+    def request(self, key, iteration, request, sample, energy):
+        self.workbook["Requests"].append(sample_row(key, iteration, request, sample, energy))
+
+    def summary(self, key, samples, total_energy, wall_time, merged=False):
+        histogram, corrected = Histogram(), Histogram()
+        for sample in samples:
+            if sample.status == "success":
+                histogram.record(sample.elapsed)
+                corrected.record(sample.corrected)
+        row = summarize(key, samples, total_energy, wall_time, histogram, corrected)
+        self.workbook["Summary"].append(row)
+        record = {"key": dict(zip(KEY_FIELDS, key)), "histogram": histogram.to_dict(),
+                  "corrected": corrected.to_dict()}
+        if merged:
+            record["merged"] = True
+        with open(self.histograms, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return row
+
+    def workers(self, key, stats):
+        for stat in stats:
+            utilization = stat["cpu"] / stat["wall"] if stat["wall"] else None
+            self.append("Workers", WORKER_COLUMNS, [*key, stat["worker"], stat["host"], stat["pid"], stat["requests"],
+                                                    stat["cpu"], stat["wall"], utilization, stat["skew"] * 1000])
+            if utilization and utilization > BUSY_WORKER:
+                print(f"  Warning: worker {stat['worker']} on {stat['host']} used {utilization:.0%} of a CPU; "
+                      f"the client may be limiting the load, add --workers")
+
+    def append(self, title, columns, row):
+        """Append row to a sheet that is only created when a mode needs it."""
+        if title not in self.workbook.sheetnames:
+            self.workbook.create_sheet(title).append(columns)
+        self.workbook[title].append(row)
+
+    def save(self):
+        self.workbook.save(self.output)
+
+def check_coalesced(summary):
+    """A level with coalesced responses didn't put its load on the function."""
+    if summary["Coalesced"]:
+        print(f"  Error: level failed, the function coalesced {summary['Coalesced']} responses; "
+              f"deploy it with coalesce: false")
+
+def print_iteration(i, iteration, energy):
+    times = ", ".join(f"{s.elapsed:.4f}s" if s.elapsed is not None else s.status for s in iteration)
+    print(f"  iteration {i + 1}: counts {[s.count for s in iteration]}, times {times}, energy {energy:.6f} mWh")
+
+async def run_image(report, key, json_data, gateway, path, concurrency, iterations, interval, meter, workers=None):
+    image = key[-1]
+    if workers:
+        energy_before = meter.read()
+        results, wall_time, stats = await workers.closed_loop(gateway.url, path, image, concurrency,
+                                                              iterations, interval)
+        # The workers' iterations don't line up, so energy is only known for the image as a whole
+        total_energy = max(meter.read() - energy_before, 0)
+        energies = [total_energy / iterations] * iterations
+        for i, iteration in enumerate(results):
+            print_iteration(i, iteration, energies[i])
+    else:
+        results, energies = [], []
+        cpu = time.process_time()
+        start = time.monotonic()
+        for i in range(iterations):
+            energy_before = meter.read()
+            intended = i * interval if interval else None
+            results.append(await run_iteration(image, json_data, gateway, path, concurrency, start, intended))
+            energies.append(max(meter.read() - energy_before, 0))
+            print_iteration(i, results[-1], energies[-1])
+        wall_time = time.monotonic() - start
+        stats = [worker_stats(0, iterations * concurrency, time.process_time() - cpu, wall_time)]
+        total_energy = sum(energies)
+    samples = []
+    for i, (iteration, energy) in enumerate(zip(results, energies)):
+        samples.extend(iteration)
+        for n, sample in enumerate(iteration):
+            report.request(key, i + 1, n + 1, sample, energy)
+    report.summary(key, samples, total_energy, wall_time)
+    report.workers(key, stats)
+    return samples, total_energy, wall_time
+
+async def run_rate(report, key, payloads, gateway, path, offsets, meter, workers=None):
+    images = list(payloads)
+    sends = [(offset, images[n % len(images)]) for n, offset in enumerate(offsets)]
+    energy_before = meter.read()
+    if workers:
+        samples, wall_time, stats = await workers.open_loop(gateway.url, path, sends)
+    else:
+        cpu = time.process_time()
+        samples, wall_time = await run_open_loop(payloads, gateway, path, sends)
+        stats = [worker_stats(0, len(samples), time.process_time() - cpu, wall_time)]
+    total_energy = max(meter.read() - energy_before, 0)
+    for n, sample in enumerate(samples):
+        report.request(key, 1, n + 1, sample, total_energy)
+    summary = dict(zip(SUMMARY_COLUMNS, report.summary(key, samples, total_energy, wall_time)))
+    report.workers(key, stats)
+    print(f"  {len(samples)} requests in {wall_time:.1f}s, {summary['Errors']} errors, "
+          f"throughput {summary['Throughput (rps)'] or 0:.2f} rps, max send lag {summary['Max Send Lag (ms)'] or 0:.1f} ms")
+    if summary["Mean Server (ms)"] is not None:
+        print("  mean " + ", ".join(f"{step} {summary[f'Mean {step.capitalize()} (ms)']:.1f}ms" for step in STEPS)
+              + f", decode {summary['Mean Decode (ms)']:.1f}ms")
+    for label in ("", "Corrected "):
+        print(f"  {label or 'Uncorrected '}" + ", ".join(f"p{p:g} {summary[f'{label}p{p:g} (s)'] or 0:.3f}s" for p in PERCENTILES))
+    check_coalesced(summary)
+    return summary
+
+async def run_level(report, key, args, load, payloads, gateway, meter, rng, workers=None):
+    """One load level of a function on a device; returns its summary as a dict."""
+    run, target, function = key
+    path = "/function/" + function
+    if args.mode != "closed":
+        print(f"{target} {function} {args.mode} {load} rps for {args.duration}s")
+        offsets = schedule(args.mode, load, args.duration, rng)
+        summary = await run_rate(report, (*key, args.mode, load, "all"), payloads, gateway, path, offsets, meter,
+                                 workers)
+        report.save()
+        return summary
+    level = ([], 0, 0)
+    for image, json_data in payloads.items():
+        print(f"{target} {function} x{load} {image}")
+        samples, energy, wall_time = await run_image(report, (*key, "closed", load, image), json_data, gateway,
+                                                     path, load, args.iterations, args.interval, meter, workers)
+        level = (level[0] + samples, level[1] + energy, level[2] + wall_time)
+        # Saved after every image, so an interrupted sweep keeps what it measured
+        report.save()
+    # Every image of the level together
+    summary = dict(zip(SUMMARY_COLUMNS, report.summary((*key, "closed", load, "all"), *level, merged=True)))
+    report.save()
+    check_coalesced(summary)
+    return summary
+
+async def find_knee(report, key, args, payloads, gateway, meter, rng, workers=None):
+    """Raise the load from the first --concurrency or --rates level until the function saturates."""
+    if args.mode != "closed":
+        start, step = args.rates[0], args.step or args.rates[0]
+    else:
+        start, step = args.concurrency[0], max(int(args.step or args.concurrency[0]), 1)
+    search = KneeSearch(start, step, args.max_load, args.slo, args.slo_percentile,
+                        args.plateau, args.max_errors)
+    for load in search.loads():
+        search.observe(load, await run_level(report, key, args, load, payloads, gateway, meter, rng, workers))
+    knee = search.knee()
+    if knee is None:
+        row = [*key, args.mode, args.slo, args.slo_percentile, *[None] * 6, len(search.levels), search.reason]
+        print(f"{key[1]} {key[2]}: no knee ({search.reason})")
+    else:
+        load, best, summary = knee
+        row = [*key, args.mode, args.slo, args.slo_percentile, load, best, summary["Throughput (rps)"],
+               summary[f"Corrected p{args.slo_percentile:g} (s)"], summary["Energy per Request (mWh)"],
+               len(search.levels), search.reason]
+        print(f"{key[1]} {key[2]}: knee at {load:g}, max sustainable throughput {best:.2f} rps, "
+              f"{summary['Energy per Request (mWh)'] or 0:.6f} mWh per request ({search.reason})")
+    report.append("Knees", KNEE_COLUMNS, row)
+    report.save()
+
+async def run_cold(report, key, payloads, gateway, function, repetitions, command, auth, wait, meter):
+    """Make function cold, then send one request, repetitions times."""
+    images = list(payloads.items())
+    samples, total_energy, wall_time = [], 0, 0
+    for i in range(repetitions):
+        image, json_data = images[i % len(images)]
+        sample = Sample(image, 0)
+        try:
+            if command:
+                await asyncio.sleep(wait)
+                energy_before = meter.read()
+                start = time.monotonic()
+                await coldstart.run_command(command, function)
+                await coldstart.wait_ready(gateway, function)
+            else:
+                await coldstart.scale_to_zero(gateway, function, auth)
+                await asyncio.sleep(wait)
+                energy_before = meter.read()
+                start = time.monotonic()
+        except (RuntimeError, subprocess.CalledProcessError, aiohttp.ClientError) as e:
+            print(f"  repetition {i + 1}: Error: could not make {function} cold: {e}")
+            continue
+        await send_request(sample, json_data, gateway, "/function/" + function, start)
+        wall_time += time.monotonic() - start
+        energy = max(meter.read() - energy_before, 0)
+        startup, started = None, None
+        if sample.status == "success":
+            startup, started = await coldstart.startup_report(gateway, function)
+        steps = coldstart.breakdown(sample, startup, started)
+        cold = sample.result.get("cold_start") if sample.result else None
+        report.request(key, i + 1, 1, sample, energy)
+        report.append("Cold Starts", COLD_COLUMNS, [*key[:3], i + 1, image, sample.status, cold, sample.corrected,
+                           *(steps[step] if steps else None for step in coldstart.STEPS),
+                           startup["round_trip_seconds"] if startup else None, energy])
+        samples.append(sample)
+        total_energy += energy
+        if steps:
+            print(f"  repetition {i + 1}: {sample.corrected:.3f}s to first response"
+                  + ("" if cold else " (warm, not a cold start)") + ", "
+                  + ", ".join(f"{step.replace('_', ' ')} {steps[step]:.3f}s" for step in coldstart.STEPS))
+        else:
+            print(f"  repetition {i + 1}: {sample.status}")
+        report.save()
+    report.summary(key, samples, total_energy, wall_time)
+
+def parse_list(value):
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Crowd counting benchmark sweep over devices, functions and concurrency levels.")
+    parser.add_argument("--targets", type=parse_list, default=["server"], help=f"comma separated, from {', '.join(TARGETS)}")
+    parser.add_argument("--functions", type=parse_list, default=["crowdcounttflite"])
+    parser.add_argument("--mode", choices=["closed", "poisson", "constant", "cold"], default="closed",
+                        help="closed loop, open loop with Poisson or evenly spaced arrivals, or cold starts")
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in parse_list(v)], default=[1, 2, 3],
+                        help="closed loop: concurrent requests per iteration, comma separated levels")
+    parser.add_argument("--iterations", type=int, default=5, help="closed loop: iterations per image")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="closed loop: seconds between iteration starts; a late iteration's wait is counted "
+                             "in its corrected latency (default: back to back, nothing to correct)")
+    parser.add_argument("--rates", type=lambda v: [float(r) for r in parse_list(v)], default=[1.0],
+                        help="open loop: target requests per second, comma separated levels")
+    parser.add_argument("--duration", type=float, default=60, help="open loop: seconds per rate level")
+    parser.add_argument("--knee", action="store_true",
+                        help="raise the load from the first level by --step until latency passes --slo, "
+                             "requests fail or throughput stops growing, and report the knee")
+    parser.add_argument("--step", type=float, help="knee: load added per level (default: the first level)")
+    parser.add_argument("--max-load", type=float, default=64, help="knee: highest load to try")
+    parser.add_argument("--slo", type=float, help="knee: latency objective in seconds (default: none, "
+                                                  "stop only when throughput stops growing)")
+    parser.add_argument("--slo-percentile", type=float, default=99, choices=PERCENTILES,
+                        help="knee: corrected latency percentile held to --slo")
+    parser.add_argument("--plateau", type=float, default=0.05,
+                        help="knee: throughput gain below this fraction counts as no gain")
+    parser.add_argument("--max-errors", type=float, default=0.01, help="knee: fraction of failed requests allowed")
+    parser.add_argument("--repetitions", type=int, default=10, help="cold: cold starts per function")
+    parser.add_argument("--cold-command",
+                        help="cold: shell command that restarts {function}, instead of scaling it to zero "
+                             "through the gateway; timed from when it starts")
+    parser.add_argument("--cold-wait", type=float, default=5,
+                        help="cold: seconds to let the node settle before each cold start")
+    parser.add_argument("--connections", type=int, default=256,
+                        help="keep-alive connections per gateway; requests beyond this wait for one")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="worker processes to split each level over (default: send from this process)")
+    parser.add_argument("--agents", type=parse_list, default=[],
+                        help="comma separated host:port of load agents (loadgen.py --listen) to split levels over too")
+    parser.add_argument("--start-delay", type=float, default=2,
+                        help="seconds ahead of time the workers are told to start together")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the Poisson schedule")
+    parser.add_argument("--images", type=parse_list, default=IMAGES, help="names or glob patterns in --image-dir")
+    parser.add_argument("--image-dir", default=os.getenv("IMAGE_DIRECTORY", "."))
+    parser.add_argument("--format", choices=["pickle", "jpeg", "png"], default="pickle",
+                        help="send pickled arrays (like the device scripts) or the encoded files")
+    parser.add_argument("--payload-cache", default=os.getenv("PAYLOAD_CACHE", os.path.expanduser("~/.cache/crowdcount/payloads")),
+                        help="directory the request bodies are built into once and memory-mapped from")
+    parser.add_argument("--energy", default="auto", help="rapl, serial[:port], none, or auto for the target's default")
+    parser.add_argument("--output", default=os.getenv("BENCHMARK_XLSX", "benchmark.xlsx"))
+    parser.add_argument("--histograms", help="JSON lines file the latency histograms are appended to "
+                                             "(default: --output with .hdr.jsonl)")
+    parser.add_argument("--url", help="gateway URL, instead of the target's .env variable")
+    parser.add_argument("--no-login", action="store_true", help="skip the target's faas-cli login script")
+    args = parser.parse_args()
+    if not args.url:
+        missing = [TARGETS[target][0] for target in args.targets if not gateway_url(TARGETS[target][0])]
+        if missing:
+            parser.error(f"set {', '.join(missing)} (or pass --url) for the gateway URL")
+    if args.agents and not os.getenv("LOADGEN_TOKEN"):
+        parser.error("--agents needs LOADGEN_TOKEN, the token the load agents were started with")
+    if args.mode == "constant" and min(args.rates) * args.duration < 1:
+        parser.error("--rates times --duration must be at least 1 request per level in constant mode")
+    asyncio.run(sweep(args))
+
+async def sweep(args):
+    cache = PayloadCache(args.payload_cache)
+    files = {}
+    for path in image_paths(args.image_dir, args.images):
+        try:
+            files[os.path.basename(path)] = cache.build(path, args.format)
+        except ValueError as e:
+            print(f"Error: {e}")
+    if not files:
+        exit(1)
+    payloads = {image: map_body(path) for image, path in files.items()}
+    print(f"{len(payloads)} payloads ({cache.hits} cached, {cache.built} built in {cache.encode_time:.2f}s) "
+          f"in {args.payload_cache}")
+
+    report = Report(args.output, args.histograms or os.path.splitext(args.output)[0] + ".hdr.jsonl")
+    run = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    meters = {}
+    rng = np.random.default_rng(args.seed)
+    gateways = Gateways(args.connections)
+    workers = None
+    if args.workers or args.agents:
+        workers = Workers(args.workers, args.agents, args.payload_cache,
+                          {image: os.path.basename(path) for image, path in files.items()},
+                          args.connections, args.start_delay, os.getenv("LOADGEN_TOKEN", ""))
+    try:
+        for target in args.targets:
+            url_env, login_env, password_env, default_energy = TARGETS[target]
+            if not args.no_login and not setup_openfaas(os.getenv(login_env)):
+                continue
+            source = default_energy if args.energy == "auto" else args.energy
+            if source not in meters:
+                meters[source] = open_meter(source)
+            gateway = gateways.get(args.url or gateway_url(url_env))
+            for function in args.functions:
+                if args.mode == "cold":
+                    print(f"{target} {function} {args.repetitions} cold starts")
+                    auth = basic_auth(os.getenv("OPENFAAS_USER", "admin"), os.getenv(password_env, ""))
+                    await run_cold(report, (run, target, function, "cold", 1, "all"), payloads, gateway, function,
+                                   args.repetitions, args.cold_command, auth, args.cold_wait, meters[source])
+                    report.save()
+                    continue
+                if args.knee:
+                    await find_knee(report, (run, target, function), args, payloads, gateway, meters[source], rng,
+                                    workers)
+                    continue
+                for load in (args.rates if args.mode != "closed" else args.concurrency):
+                    await run_level(report, (run, target, function), args, load, payloads, gateway,
+                                    meters[source], rng, workers)
+    finally:
+        await gateways.close()
+        if workers is not None:
+            workers.close()
+    print(f"All runs complete. Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
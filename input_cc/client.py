@@ -0,0 +1,119 @@
+import base64
+import time
+import aiohttp
+
+# Asyncio HTTP client for the benchmark. Each gateway gets one session whose
+# keep-alive connections are reused by every request, so measurements don't
+# pay for a TCP handshake each time and a single process can keep hundreds of
+# requests in flight.
+#
+# Every request is traced through aiohttp's TraceConfig hooks against
+# time.perf_counter, so its time splits into waiting for a pooled connection,
+# DNS, connecting, sending the body, waiting for the server and reading the
+# response. On a reused keep-alive connection there is no DNS or connect step.
+
+# Marks of a Timing, in the order a request passes them
+PHASES = ("queued", "dns", "connected", "sent", "first_byte", "last_byte")
+
+class Timing:
+    """Seconds from the start of a request to each phase it reached."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, phase):
+        self.marks[phase] = time.perf_counter() - self.start
+
+    def get(self, phase):
+        return self.marks.get(phase)
+
+    def steps(self):
+        """Seconds spent in each step of a request that got its whole response."""
+        if "last_byte" not in self.marks:
+            return None
+        marks = self.marks
+        # Only a request that found the pool full waits for a connection
+        queued = marks.get("queued", 0)
+        return {
+            "queued": queued,
+            "connect": marks["connected"] - queued,
+            "upload": marks["sent"] - marks["connected"],
+            "server": marks["first_byte"] - marks["sent"],
+            "download": marks["last_byte"] - marks["first_byte"],
+        }
+
+def marker(phase):
+    async def on_event(session, context, params):
+        # Untimed calls carry no Timing
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx.mark(phase)
+    return on_event
+
+def trace_config():
+    config = aiohttp.TraceConfig()
+    config.on_connection_queued_end.append(marker("queued"))
+    config.on_dns_resolvehost_end.append(marker("dns"))
+    config.on_connection_create_end.append(marker("connected"))
+    config.on_connection_reuseconn.append(marker("connected"))
+    # Headers first, then every body chunk moves the mark, so it ends up
+    # when the last byte of the request was written
+    config.on_request_headers_sent.append(marker("sent"))
+    config.on_request_chunk_sent.append(marker("sent"))
+    # aiohttp reports the response once its headers are parsed, the closest
+    # it gets to the first byte
+    config.on_request_end.append(marker("first_byte"))
+    return config
+
+class Gateway:
+    """Connection pool to one OpenFaaS gateway."""
+
+    def __init__(self, url, connections=256, timeout=300):
+        self.url = url.rstrip("/")
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=connections, limit_per_host=connections, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            headers={'Content-Type': 'application/json'},
+            trace_configs=[trace_config()])
+
+    async def post(self, path, body, timing=None):
+        """POST body to path; returns (status, content, response headers, timing).
+
+        A timing passed in is filled as far as the request got, even if it
+        raises.
+        """
+        timing = timing or Timing()
+        async with self.session.post(self.url + path, data=body, trace_request_ctx=timing) as response:
+            content = await response.read()
+            timing.mark("last_byte")
+            return response.status, content, response.headers, timing
+
+    async def call(self, method, path, data=None, headers=None):
+        """An untimed request, for the gateway's API; returns (status, content)."""
+        async with self.session.request(method, self.url + path, data=data, headers=headers) as response:
+            return response.status, await response.read()
+
+    async def close(self):
+        await self.session.close()
+
+def basic_auth(user, password):
+    """Authorization header for the gateway's API."""
+    token = base64.b64encode(f"{user}:{password}".encode()).decode("ascii")
+    return {"Authorization": f"Basic {token}"}
+
+class Gateways:
+    """One Gateway per URL, opened on first use."""
+
+    def __init__(self, connections=256, timeout=300):
+        self.connections = connections
+        self.timeout = timeout
+        self.pools = {}
+
+    def get(self, url):
+        if url not in self.pools:
+            self.pools[url] = Gateway(url, self.connections, self.timeout)
+        return self.pools[url]
+
+    async def close(self):
+        for pool in self.pools.values():
+            await pool.close()
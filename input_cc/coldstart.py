@@ -0,0 +1,98 @@
+import asyncio
+import json
+import subprocess
+import time
+import aiohttp
+
+# Cold starts for the benchmark's --mode cold. Before every repetition the
+# function is either scaled to zero through the gateway's API, so the request
+# that follows makes the gateway start a new replica, or restarted by a shell
+# command, such as restarting its faasd task or a local stand-in container.
+# A restarted function gets its request once its ready endpoint answers, and
+# its time to first response counts from when the command started.
+#
+# The first response is split up using the function's startup report
+# (/_/startup; the watchdog answers the ready endpoint itself, without a
+# body), which says how long the process has been up and how long importing
+# the function, loading the model and warming up took:
+#
+#   fired ... container start ... import ... model load ... warmup ... first inference ... response
+
+# Steps of a cold start, in the order they happen
+STEPS = ("container", "import", "model_load", "warmup", "first_inference", "other")
+
+async def scale_to_zero(gateway, function, auth, timeout=120):
+    """Scale function to zero replicas and wait until none is left; auth is
+    the API's Authorization header."""
+    body = json.dumps({"serviceName": function, "replicas": 0})
+    status, content = await gateway.call("POST", f"/system/scale-function/{function}", body, auth)
+    if status >= 400:
+        raise RuntimeError(f"Scaling {function} to zero failed: HTTP {status} {content[:200]!r}")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status, content = await gateway.call("GET", f"/system/function/{function}", headers=auth)
+        if status == 200 and json.loads(content).get("availableReplicas", 0) == 0:
+            return
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"{function} still has a replica {timeout}s after scaling to zero")
+
+async def run_command(command, function):
+    """Run the shell command that makes function cold; {function} is replaced by its name."""
+    await asyncio.to_thread(subprocess.run, command.format(function=function), shell=True, check=True,
+                            stdout=subprocess.DEVNULL)
+
+async def wait_ready(gateway, function, timeout=300):
+    """Wait until the function's ready endpoint answers 200."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            status, _ = await gateway.call("GET", f"/function/{function}/_/ready")
+            if status == 200:
+                return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.05)
+    raise RuntimeError(f"{function} not ready {timeout}s after the cold command")
+
+async def startup_report(gateway, function):
+    """The function's startup report, and when its process started (perf_counter
+    time); (None, None) if it has none to give."""
+    sent = time.perf_counter()
+    try:
+        status, content = await gateway.call("GET", f"/function/{function}/_/startup")
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None, None
+    received = time.perf_counter()
+    if status != 200:
+        return None, None
+    try:
+        report = json.loads(content)
+    except ValueError:
+        return None, None
+    if not isinstance(report, dict) or "uptime_seconds" not in report or "import_seconds" not in report:
+        return None, None
+    report["round_trip_seconds"] = received - sent
+    # The uptime is taken as of the middle of the round trip
+    return report, (sent + received) / 2 - report["uptime_seconds"]
+
+def breakdown(sample, report, started):
+    """Seconds spent in each step of a cold start, from when it was triggered.
+
+    The sample's intended start is when the cold start was triggered, so its
+    corrected latency is the time to first response.
+    """
+    if sample.elapsed is None or report is None:
+        return None
+    triggered = sample.timing.start - (sample.sent - sample.intended)
+    container = started - triggered
+    # The function's import includes loading its model
+    model_load = report.get("model_load_seconds", 0)
+    steps = {
+        "container": container,
+        "import": report["import_seconds"] - model_load,
+        "model_load": model_load,
+        "warmup": report.get("warmup_seconds", 0),
+        "first_inference": sample.result.get("timings", {}).get("inference", 0) / 1000,
+    }
+    steps["other"] = sample.corrected - sum(steps.values())
+    return steps
@@ -0,0 +1,81 @@
+import glob
+import threading
+
+# Energy sources for the benchmark. Each one reports the energy used since it
+# was opened in mWh; callers take the difference between two readings.
+
+class Rapl:
+    """CPU package energy from the kernel's RAPL counters (the fog server)."""
+
+    def __init__(self):
+        paths = sorted(glob.glob('/sys/class/powercap/intel-rapl:*/energy_uj'))
+        if not paths:
+            raise RuntimeError("Could not find a RAPL 'energy_uj' file. Run with sudo or load the intel-rapl/amd_energy module.")
+        self.path = paths[0]
+        try:
+            with open(self.path.replace("energy_uj", "max_energy_range_uj")) as f:
+                self.wrap = int(f.read())
+        except (IOError, ValueError):
+            self.wrap = None
+        self.lock = threading.Lock()
+        self.last = self.raw()
+        self.total_uj = 0
+
+    def raw(self):
+        with open(self.path) as f:
+            return int(f.read())
+
+    def read(self):
+        with self.lock:
+            now = self.raw()
+            delta = now - self.last
+            if delta < 0:  # the counter wrapped around
+                delta += self.wrap or 0
+            self.last = now
+            self.total_uj += max(delta, 0)
+            # 1 mWh = 3.6 J = 3.6e6 uJ
+            return self.total_uj / 3.6e6
+
+class SerialMeter:
+    """USB power meter on the edge devices' supply, sending "ms;mA;V" lines."""
+
+    def __init__(self, port='/dev/ttyUSB0', baudrate=115200):
+        import serial
+        self.serial = serial.Serial(port, baudrate, timeout=1)
+        self.lock = threading.Lock()
+        self.total_mwh = 0.0
+        threading.Thread(target=self.integrate, daemon=True).start()
+
+    def integrate(self):
+        prev_time = None
+        while True:
+            line = self.serial.readline().decode('utf-8', errors='ignore').strip()
+            try:
+                timestamp_str, current_str, voltage_str = line.split(";")
+                timestamp = int(timestamp_str)
+                power = float(current_str) * float(voltage_str)  # mW
+            except ValueError:
+                continue
+            if prev_time is not None:
+                with self.lock:
+                    self.total_mwh += power * (timestamp - prev_time) / 3600000
+            prev_time = timestamp
+
+    def read(self):
+        with self.lock:
+            return self.total_mwh
+
+class NoMeter:
+    def read(self):
+        return 0.0
+
+def open_meter(source):
+    """rapl, serial[:port] or none."""
+    name, _, port = source.partition(":")
+    if name == "rapl":
+        return Rapl()
+    if name == "serial":
+        return SerialMeter(port or '/dev/ttyUSB0')
+    if name == "none":
+        return NoMeter()
+    raise ValueError(f"Unknown energy source {source!r}, expected rapl, serial[:port] or none")
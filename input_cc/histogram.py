@@ -0,0 +1,141 @@
+import json
+import math
+import sys
+import numpy as np
+
+# High-dynamic-range latency histogram with HdrHistogram's log-linear layout:
+# values up to sub_bucket_count are counted exactly, and every power of two
+# above that is split into sub_bucket_count / 2 buckets, so any value is
+# recorded to within the configured number of significant digits. Histograms
+# with the same configuration merge by adding their counts, so runs from
+# different devices or processes can be combined before taking percentiles.
+#
+#   python histogram.py results.hdr.jsonl [--group device,function,load] [--corrected]
+#
+# --corrected merges the latencies counted from each request's intended start
+# (corrected for coordinated omission) instead of its actual one.
+
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+class Histogram:
+    """Latencies in microseconds, from 1 us up to highest_us."""
+
+    def __init__(self, significant_digits=3, highest_us=3600 * 10**6):
+        self.significant_digits = significant_digits
+        self.highest_us = highest_us
+        self.sub_bits = math.ceil(math.log2(2 * 10**significant_digits))
+        self.sub_bucket_count = 1 << self.sub_bits
+        self.half = self.sub_bucket_count // 2
+        self.counts = np.zeros(self.index(highest_us) + 1, dtype=np.int64)
+        self.total = 0
+        self.min_us = None
+        self.max_us = None
+        self.sum_us = 0
+
+    def index(self, value):
+        bucket = max(value.bit_length() - self.sub_bits, 0)
+        if bucket == 0:
+            return value
+        return self.sub_bucket_count + (bucket - 1) * self.half + (value >> bucket) - self.half
+
+    def highest_equivalent(self, index):
+        """The largest value counted at index."""
+        if index < self.sub_bucket_count:
+            return index
+        bucket, sub = divmod(index - self.sub_bucket_count, self.half)
+        bucket += 1
+        return ((sub + self.half + 1) << bucket) - 1
+
+    def record(self, seconds, count=1):
+        value = min(max(int(round(seconds * 1e6)), 0), self.highest_us)
+        self.counts[self.index(value)] += count
+        self.total += count
+        self.sum_us += value * count
+        self.min_us = value if self.min_us is None else min(self.min_us, value)
+        self.max_us = value if self.max_us is None else max(self.max_us, value)
+
+    def merge(self, other):
+        if (other.significant_digits, other.highest_us) != (self.significant_digits, self.highest_us):
+            raise ValueError("Histograms with different precision or range can't be merged")
+        self.counts += other.counts
+        self.total += other.total
+        self.sum_us += other.sum_us
+        for value in (other.min_us, other.max_us):
+            if value is not None:
+                self.min_us = value if self.min_us is None else min(self.min_us, value)
+                self.max_us = value if self.max_us is None else max(self.max_us, value)
+        return self
+
+    def percentile(self, p):
+        """Latency in seconds at or below which p percent of the values fall."""
+        if not self.total:
+            return None
+        rank = max(math.ceil(p / 100 * self.total), 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self.highest_equivalent(index), self.max_us) / 1e6
+
+    def percentiles(self):
+        return {f"p{p:g}": self.percentile(p) for p in PERCENTILES}
+
+    def mean(self):
+        return self.sum_us / self.total / 1e6 if self.total else None
+
+    def to_dict(self):
+        """JSON-friendly form; only the buckets that were hit are stored."""
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            "significant_digits": self.significant_digits,
+            "highest_us": self.highest_us,
+            "min_us": self.min_us,
+            "max_us": self.max_us,
+            "sum_us": self.sum_us,
+            "counts": {int(i): int(self.counts[i]) for i in nonzero}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["significant_digits"], data["highest_us"])
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+        histogram.total = int(histogram.counts.sum())
+        histogram.min_us, histogram.max_us, histogram.sum_us = data["min_us"], data["max_us"], data["sum_us"]
+        return histogram
+
+def read_records(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def merge_records(records, group, field="histogram"):
+    """Merge the records' histograms by the values of the group fields."""
+    merged = {}
+    for record in records:
+        # Rows the benchmark already merged from other records would count twice
+        if record.get("merged"):
+            continue
+        key = tuple(record["key"].get(name) for name in group)
+        histogram = Histogram.from_dict(record[field])
+        if key in merged:
+            merged[key].merge(histogram)
+        else:
+            merged[key] = histogram
+    return merged
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    group = ["device", "function", "mode", "load"]
+    if "--group" in args:
+        i = args.index("--group")
+        group = args[i + 1].split(",")
+        del args[i:i + 2]
+    field = "histogram"
+    if "--corrected" in args:
+        args.remove("--corrected")
+        field = "corrected"
+    merged = merge_records(read_records(args), group, field)
+    print(" | ".join(group) + " | requests | mean | " + " | ".join(f"p{p:g}" for p in PERCENTILES) + " (ms)")
+    for key, histogram in sorted(merged.items(), key=lambda item: str(item[0])):
+        values = [histogram.mean()] + [histogram.percentile(p) for p in PERCENTILES]
+        print(" | ".join(str(v) for v in key) + f" | {histogram.total} | " + " | ".join("-" if v is None else f"{v * 1000:.1f}" for v in values))
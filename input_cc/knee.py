@@ -0,0 +1,62 @@
+# Saturation search for the benchmark's --knee: the load (concurrency in the
+# closed loop, requests per second in the open loop) goes up step by step
+# until a latency percentile passes the SLO, too many requests fail, or
+# throughput stops growing. Of the levels that met the SLO, the knee is the
+# lowest load whose throughput is within plateau of the best one: past it,
+# more load only adds queuing. A run where the function coalesced any
+# responses has no knee, since the load it measured isn't the load sent.
+
+class KneeSearch:
+    def __init__(self, start, step, max_load, slo=None, percentile=99, plateau=0.05, max_errors=0.01, patience=2):
+        self.start = start
+        self.step = step
+        self.max_load = max_load
+        self.slo = slo
+        self.percentile = percentile
+        self.plateau = plateau
+        self.max_errors = max_errors
+        # Levels in a row that may fail to raise throughput before the search stops
+        self.patience = patience
+        self.levels = []
+        self.flat = 0
+        self.reason = None
+        self.rejected = False
+
+    def loads(self):
+        load = self.start
+        while self.reason is None:
+            if load > self.max_load:
+                self.reason = "reached the maximum load"
+                return
+            yield load
+            load = round(load + self.step, 6)
+
+    def observe(self, load, summary):
+        """Record a level's summary row (as a dict) and decide whether to go on."""
+        latency = summary[f"Corrected p{self.percentile:g} (s)"]
+        errors = summary["Errors"] / summary["Requests"] if summary["Requests"] else 1
+        throughput = summary["Throughput (rps)"] or 0
+        if summary["Coalesced"]:
+            self.rejected = True
+            self.reason = f"{summary['Coalesced']} responses were coalesced at {load:g}, deploy with coalesce: false"
+            return
+        if errors > self.max_errors:
+            self.reason = f"{errors:.1%} of the requests failed at {load:g}"
+            return
+        if self.slo is not None and (latency is None or latency > self.slo):
+            self.reason = f"p{self.percentile:g} of {latency or 0:.3f}s is over the SLO at {load:g}"
+            return
+        best = max((level[1] for level in self.levels), default=0)
+        self.levels.append((load, throughput, summary))
+        self.flat = self.flat + 1 if throughput < best * (1 + self.plateau) else 0
+        if self.flat >= self.patience:
+            self.reason = f"throughput stopped growing at {load:g}"
+
+    def knee(self):
+        """(load, max sustainable throughput, summary of the knee level), or None."""
+        if self.rejected or not self.levels:
+            return None
+        best = max(level[1] for level in self.levels)
+        for load, throughput, summary in self.levels:
+            if throughput >= best * (1 - self.plateau):
+                return load, best, summary
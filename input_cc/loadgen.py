@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import hmac
+import itertools
+import json
+import os
+import re
+import socket
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import aiohttp
+from client import Gateway, Timing
+from payloads import map_body
+
+# Sending the benchmark's requests, in the benchmark process itself or spread
+# over worker processes, so the client's JSON and HTTP work doesn't hold the
+# load back behind one interpreter's GIL. Workers are local processes
+# (--workers) or load agents on other hosts (--agents), started with
+#
+#   LOADGEN_TOKEN=... python loadgen.py --listen 0.0.0.0:7070 [--payload-cache DIR]
+#
+# An agent runs whatever job it is sent against whatever URL the job names,
+# so it listens on 127.0.0.1 by default and only takes jobs that carry the
+# shared token (LOADGEN_TOKEN, on the agents and the benchmark alike).
+#
+# Each worker gets a share of a level: every Nth send of the open-loop
+# schedule, or part of the closed loop's concurrency. The shares start
+# together at a wall-clock time set a few seconds ahead, so the agents' clocks
+# should be synchronized (NTP). Workers send back their samples, which are
+# merged into the level's histograms, and the CPU time they used.
+#
+# Agents get the request bodies by name from their own payload cache and are
+# sent the ones they don't have yet, so an image is only transferred once.
+# Names must be payload cache names, so a job can't write outside the cache.
+#
+# Every request gets a nonce field of its own in front of the cached body. A
+# function with coalescing on would otherwise answer identical requests in
+# flight with one inference; a response it coalesced anyway (X-Coalesced)
+# counts as failed.
+
+# Payload cache file names: the image's SHA-256 and the body's format
+BODY_NAME = re.compile(r"[0-9a-f]{64}\.(pickle|jpeg|png)\.json")
+
+# Unique across hosts; forked worker processes tell theirs apart by PID
+NONCE_PREFIX = os.urandom(6).hex()
+nonces = itertools.count()
+
+def parse_result(content):
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        matches = re.findall(rb'({.*})', content)
+        if matches:
+            return json.loads(matches[-1].decode())
+        raise ValueError("No JSON object found in response")
+
+def unique(body):
+    """body (a JSON object) with a nonce field in front; one copy of the body."""
+    nonce = f'{{"nonce": "{NONCE_PREFIX}-{os.getpid()}-{next(nonces)}", '.encode()
+    return b"".join((nonce, memoryview(body)[1:]))
+
+class Sample:
+    """One request: what it returned and when it was meant to and did go out."""
+
+    def __init__(self, image, intended):
+        self.image = image
+        self.intended = intended
+        self.sent = None
+        self.count = None
+        self.elapsed = None
+        self.status = None
+        self.timing = None
+        self.decode = None
+        self.coalesced = False
+        self.result = None
+
+    @property
+    def corrected(self):
+        """Latency counted from the intended start rather than the actual one."""
+        if self.elapsed is None:
+            return None
+        return self.elapsed + max(self.sent - self.intended, 0)
+
+    def to_dict(self):
+        """What a worker sends back; the parsed response stays behind."""
+        return {"image": self.image, "intended": self.intended, "sent": self.sent, "count": self.count,
+                "elapsed": self.elapsed, "status": self.status, "decode": self.decode,
+                "coalesced": self.coalesced, "marks": self.timing.marks if self.timing else None}
+
+    @classmethod
+    def from_dict(cls, data):
+        sample = cls(data["image"], data["intended"])
+        sample.sent, sample.count, sample.elapsed = data["sent"], data["count"], data["elapsed"]
+        sample.status, sample.decode, sample.coalesced = data["status"], data["decode"], data["coalesced"]
+        if data["marks"] is not None:
+            sample.timing = Timing()
+            sample.timing.marks = data["marks"]
+        return sample
+
+async def send_request(sample, json_data, gateway, path, start):
+    """Sends a single request and fills in sample."""
+    body = unique(json_data)
+    sample.sent = time.monotonic() - start
+    sample.timing = Timing()
+    try:
+        status, content, headers, _ = await gateway.post(path, body, sample.timing)
+        sample.elapsed = sample.timing.get("last_byte")
+        if status >= 400:
+            raise ValueError(f"HTTP {status}")
+        # Another request's inference, so its latency says nothing about this one
+        sample.coalesced = headers.get("X-Coalesced") == "true"
+        if sample.coalesced:
+            raise ValueError("coalesced with another request")
+        decode_start = time.perf_counter()
+        sample.result = result = parse_result(content)
+        sample.decode = time.perf_counter() - decode_start
+        sample.count = result.get("count")
+        sample.status = result.get("status", "success")
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        sample.elapsed = None
+        sample.status = f"error: {str(e) or type(e).__name__}"
+    return sample
+
+async def run_iteration(image, json_data, gateway, path, concurrency, start, intended=None):
+    """Closed loop: send concurrency requests at once and wait for all of them.
+
+    intended is when the iteration should have started; without one it is
+    intended to start now.
+    """
+    now = time.monotonic() - start
+    if intended is None:
+        intended = now
+    elif intended > now:
+        await asyncio.sleep(intended - now)
+    return await asyncio.gather(*(send_request(Sample(image, intended), json_data, gateway, path, start)
+                                  for _ in range(concurrency)))
+
+async def run_open_loop(payloads, gateway, path, sends, start=None):
+    """Send one request for each (offset, image), whatever earlier ones are doing."""
+    start = start or time.monotonic()
+    tasks = []
+    for offset, image in sends:
+        delay = start + offset - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send_request(Sample(image, offset), payloads[image], gateway, path, start)))
+    samples = await asyncio.gather(*tasks)
+    return samples, time.monotonic() - start
+
+def worker_stats(worker, requests, cpu, wall, skew=0):
+    return {"worker": worker, "host": socket.gethostname(), "pid": os.getpid(), "requests": requests,
+            "cpu": cpu, "wall": wall, "skew": skew}
+
+def run_share(job):
+    """A worker's share of a level; runs in a worker process."""
+    return asyncio.run(share(job))
+
+async def share(job):
+    gateway = Gateway(job["url"], job["connections"])
+    payloads = {image: map_body(os.path.join(job["cache"], name)) for image, name in job["bodies"].items()}
+    try:
+        cpu = time.process_time()
+        await asyncio.sleep(max(job["start_at"] - time.time(), 0))
+        skew = time.time() - job["start_at"]
+        start = time.monotonic()
+        if job["mode"] == "open":
+            samples, wall = await run_open_loop(payloads, gateway, job["path"], job["sends"], start)
+            iterations = [samples]
+        else:
+            image = job["image"]
+            iterations = []
+            for i in range(job["iterations"]):
+                intended = i * job["interval"] if job["interval"] else None
+                iterations.append(await run_iteration(image, payloads[image], gateway, job["path"],
+                                                      job["concurrency"], start, intended))
+            wall = time.monotonic() - start
+        return {"iterations": [[sample.to_dict() for sample in iteration] for iteration in iterations],
+                "stats": worker_stats(job["worker"], sum(map(len, iterations)), time.process_time() - cpu,
+                                      wall, skew)}
+    finally:
+        await gateway.close()
+
+def failed_share(job, message):
+    """The result of a share whose worker failed: each of its requests failed
+    with the worker's message, and no worker stats."""
+    status = f"error: {message}"
+    if job["mode"] == "open":
+        iterations = [[(image, offset) for offset, image in job["sends"]]]
+    else:
+        iterations = [[(job["image"], i * job["interval"])] * job["concurrency"] for i in range(job["iterations"])]
+    return {"iterations": [[{"image": image, "intended": intended, "sent": intended, "count": None, "elapsed": None,
+                             "status": status, "decode": None, "coalesced": False, "marks": None}
+                            for image, intended in iteration] for iteration in iterations],
+            "stats": None}
+
+class Workers:
+    """Local worker processes and remote load agents that a level is split over."""
+
+    def __init__(self, processes, agents, cache_dir, bodies, connections, start_delay=2, token=""):
+        self.pool = ProcessPoolExecutor(processes) if processes else None
+        self.processes = processes
+        self.agents = agents
+        # Shared with the agents, which run no job without it
+        self.token = token
+        self.cache_dir = cache_dir
+        # Cache file name of each image's body
+        self.bodies = bodies
+        self.connections = connections
+        self.start_delay = start_delay
+
+    def __len__(self):
+        return self.processes + len(self.agents)
+
+    async def run(self, jobs):
+        """Run one job per worker, all starting together; returns their results.
+
+        A worker that fails fails its share of the level rather than the sweep.
+        """
+        start_at = time.time() + self.start_delay
+        loop = asyncio.get_running_loop()
+        runs = []
+        for worker, job in enumerate(jobs):
+            job.update(worker=worker, start_at=start_at, connections=self.connections,
+                       bodies=self.bodies, cache=self.cache_dir)
+            if worker < self.processes:
+                runs.append(loop.run_in_executor(self.pool, run_share, job))
+            else:
+                runs.append(self.remote(self.agents[worker - self.processes], job))
+        results = await asyncio.gather(*runs, return_exceptions=True)
+        for worker, (job, result) in enumerate(zip(jobs, results)):
+            if isinstance(result, Exception):
+                where = "local process" if worker < self.processes else f"agent {self.agents[worker - self.processes]}"
+                message = f"worker {worker} ({where}): {str(result) or type(result).__name__}"
+                print(f"  Error: {message}")
+                results[worker] = failed_share(job, message)
+        return results
+
+    async def remote(self, agent, job):
+        host, port = agent.rsplit(":", 1)
+        reader, writer = await asyncio.open_connection(host, int(port), limit=1 << 30)
+        try:
+            writer.write(json.dumps({**job, "token": self.token}).encode() + b"\n")
+            reply = json.loads(await reader.readline())
+            if "error" in reply:
+                raise RuntimeError(reply["error"])
+            for name in reply["missing"]:
+                # A body is a single line of JSON
+                with open(os.path.join(self.cache_dir, name), "rb") as f:
+                    writer.write(f.read() + b"\n")
+            await writer.drain()
+            result = json.loads(await reader.readline())
+        finally:
+            writer.close()
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result
+
+    async def open_loop(self, url, path, sends):
+        """Deal the schedule's sends out in turn; returns (samples, wall time, worker stats)."""
+        jobs = [{"mode": "open", "url": url, "path": path, "sends": sends[k::len(self)]} for k in range(len(self))]
+        results = await self.run(jobs)
+        samples = sorted((Sample.from_dict(data) for result in results for data in result["iterations"][0]),
+                         key=lambda sample: sample.intended)
+        stats = [result["stats"] for result in results if result["stats"]]
+        return samples, max((stat["wall"] for stat in stats), default=0), stats
+
+    async def closed_loop(self, url, path, image, concurrency, iterations, interval):
+        """Split each iteration's requests between the workers; returns (iterations, wall time, worker stats)."""
+        shares = [concurrency // len(self) + (k < concurrency % len(self)) for k in range(len(self))]
+        jobs = [{"mode": "closed", "url": url, "path": path, "image": image, "concurrency": n,
+                 "iterations": iterations, "interval": interval} for n in shares if n]
+        results = await self.run(jobs)
+        merged = [[Sample.from_dict(data) for result in results for data in result["iterations"][i]]
+                  for i in range(iterations)]
+        stats = [result["stats"] for result in results if result["stats"]]
+        return merged, max((stat["wall"] for stat in stats), default=0), stats
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+async def serve(address, cache_dir, token):
+    """Load agent: run the shares a coordinating benchmark sends, one per connection."""
+    async def handle(reader, writer):
+        try:
+            job = json.loads(await reader.readline())
+            error = None
+            if not hmac.compare_digest(str(job.pop("token", "")), token):
+                error = "wrong or missing token"
+            elif not all(BODY_NAME.fullmatch(str(name)) for name in job["bodies"].values()):
+                error = "body names must be payload cache names"
+            if error is not None:
+                writer.write(json.dumps({"error": error}).encode() + b"\n")
+                await writer.drain()
+                return
+            missing = [name for name in set(job["bodies"].values())
+                       if not os.path.exists(os.path.join(cache_dir, name))]
+            writer.write(json.dumps({"missing": missing}).encode() + b"\n")
+            await writer.drain()
+            os.makedirs(cache_dir, exist_ok=True)
+            for name in missing:
+                body = (await reader.readline()).rstrip(b"\n")
+                tmp = os.path.join(cache_dir, f"{name}.{os.getpid()}.tmp")
+                with open(tmp, "wb") as f:
+                    f.write(body)
+                os.replace(tmp, os.path.join(cache_dir, name))
+            job["cache"] = cache_dir
+            # Its own process, so shares sent together start together whatever
+            # the number of CPUs
+            try:
+                with ProcessPoolExecutor(1) as pool:
+                    result = await asyncio.get_running_loop().run_in_executor(pool, run_share, job)
+            except Exception as e:
+                result = {"error": str(e) or type(e).__name__}
+            writer.write(json.dumps(result).encode() + b"\n")
+            await writer.drain()
+        finally:
+            writer.close()
+
+    host, port = address.rsplit(":", 1)
+    server = await asyncio.start_server(handle, host, int(port), limit=1 << 30)
+    print(f"Load agent listening on {address}, payload cache {cache_dir}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load agent for distributed benchmark runs.")
+    parser.add_argument("--listen", default="127.0.0.1:7070",
+                        help="host:port; use the host's own address to take jobs from other hosts")
+    parser.add_argument("--payload-cache", default=os.getenv("PAYLOAD_CACHE", os.path.expanduser("~/.cache/crowdcount/payloads")))
+    args = parser.parse_args()
+    token = os.getenv("LOADGEN_TOKEN", "")
+    if not token:
+        parser.error("set LOADGEN_TOKEN to the token shared with the benchmark")
+    asyncio.run(serve(args.listen, args.payload_cache, token))
@@ -0,0 +1,93 @@
+import pickle
+import cv2
+import requests
+import json
+import subprocess
+import base64
+import os
+import sys
+import numpy as np
+from requests.exceptions import RequestException
+from dotenv import load_dotenv
+load_dotenv()
+
+# Compares the count-only postprocessing against the full ultralytics Results
+# path on one device, using the per-stage timings returned by the function.
+# Usage: python postprocesscompare.py <server|tvbox|pi> [function] [iterations]
+
+DEVICES = {
+    "server": ("OPENFAAS_URL_SERVER", "LOGIN_SCRIPT_SERVER"),
+    "tvbox": ("OPENFAAS_URL_TVBOX", "LOGIN_SCRIPT_TVBOX"),
+    "pi": ("OPENFAAS_URL_RASPBERRYPI", "LOGIN_SCRIPT_RASPBERRYPI"),
+}
+
+def setup_openfaas(login_script):
+    try:
+        with open("/dev/null", "w") as nullfile:
+            subprocess.run(["sudo", "/bin/bash", login_script],
+                         check=True, stdout=nullfile, stderr=nullfile)
+        print("OpenFaaS connection established successfully.")
+        return True
+    except subprocess.CalledProcessError:
+        print("Error: Unable to connect to OpenFaaS server.")
+        return False
+
+def prepare_image(img_path):
+    img = cv2.imread(img_path)
+    if img is None:
+        print(f"Error: Could not load image at {img_path}")
+        return None
+    try:
+        return pickle.dumps(img)
+    except Exception as e:
+        print(f"Image processing error: {e}")
+        return None
+
+def run_mode(openfaas_url, image, mode, iterations):
+    json_data = json.dumps({
+        "image_data": {"image": image},
+        "postprocess": mode
+    })
+    timings = {}
+    counts = set()
+    for _ in range(iterations):
+        response = requests.post(openfaas_url, data=json_data, timeout=300, headers={'Content-Type': 'application/json'})
+        response.raise_for_status()
+        result = response.json()
+        if result.get("status") != "success":
+            print(f"Server error: {result.get('message', 'Unknown error')}")
+            continue
+        counts.add(result["count"])
+        for stage, ms in result["timings"].items():
+            timings.setdefault(stage, []).append(ms)
+    return counts, timings
+
+if __name__ == "__main__":
+    device = sys.argv[1] if len(sys.argv) > 1 else "server"
+    function = sys.argv[2] if len(sys.argv) > 2 else "crowdcounttflite"
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    url_env, login_env = DEVICES[device]
+
+    if not setup_openfaas(os.getenv(login_env)):
+        exit(1)
+    openfaas_url = os.getenv(url_env) + "/function/" + function
+
+    imdata = prepare_image(os.getenv("BUS_IMAGE_PATH"))
+    if imdata is None:
+        exit(1)
+    image = base64.b64encode(imdata).decode('ascii')
+
+    try:
+        results = {mode: run_mode(openfaas_url, image, mode, iterations) for mode in ("full", "count")}
+    except RequestException as e:
+        print(f"Request failed: {e}")
+        exit(1)
+
+    print(f"{function} on {device}, {iterations} requests per mode (median ms)")
+    for mode, (counts, timings) in results.items():
+        stages = ", ".join(f"{stage}: {np.median(ms):.3f}" for stage, ms in timings.items())
+        print(f"  {mode:>5} | counts {sorted(counts)} | {stages}")
+
+    full = np.median(results["full"][1]["postprocess"])
+    count = np.median(results["count"][1]["postprocess"])
+    print(f"Postprocessing overhead removed: {full - count:.3f} ms ({(1 - count / full) * 100:.1f}%)")
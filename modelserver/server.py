@@ -0,0 +1,266 @@
+# Per-node model server. It owns the loaded models and a single batching queue
+# for every function replica on the node, so each model is held in memory once
+# and frames from different replicas can share a forward pass. Replicas
+# connect over a Unix socket (newline-delimited JSON), normalize their frames
+# into a shared-memory segment of their own and get the raw model output back
+# through a segment the server keeps per connection; only the small control
+# messages cross the socket.
+#
+#   {"op": "load", "model": path}  -> model info (stride, names / input_shape)
+#   {"op": "infer", "model": path, "shm": name, "shape": [...]}
+#                                  -> {"shm": name, "shape": [...], "batch": n}
+#   {"op": "stats"}                -> counters
+#
+# Models are keyed by the path they're loaded from (.pt through ultralytics,
+# .tflite through the TFLite interpreter), which must be the same path on the
+# server as in the functions. Loading a .pt file can run arbitrary code, so
+# only the listed paths are ever loaded.
+
+import json
+import logging
+import os
+import shutil
+import socketserver
+import sys
+import threading
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+SOCKET = os.getenv("model_socket", "/run/crowdcount/models.sock")
+# Comma separated model paths loaded at start, and others that are loaded the
+# first time a replica asks for them (such as hot swap targets); no other path
+# is loaded
+PRELOAD = [path.strip() for path in os.getenv("models", "").split(",") if path.strip()]
+ALLOWED = set(PRELOAD) | {path.strip() for path in os.getenv("allowed_models", "").split(",") if path.strip()}
+# Group whose members (the function replicas' user) may connect to the socket
+SOCKET_GROUP = os.getenv("model_socket_group", "")
+# Frames with the same model and input shape that are queued together, from
+# any replica, go through the model as one batch
+MAX_BATCH = int(os.getenv("max_batch", "8"))
+TFLITE_THREADS = int(os.getenv("tflite_threads", "0")) or None
+
+os.environ['YOLO_CONFIG_DIR'] = '/tmp/Ultralytics'
+os.environ['YOLO_VERBOSE'] = 'False'
+
+def attach(name):
+    segment = shared_memory.SharedMemory(name=name)
+    # Before Python 3.13 attaching registers the segment with this process's
+    # resource tracker, which would unlink the replica's segment when we exit
+    resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+def close(segment, unlink=False):
+    try:
+        segment.close()
+        if unlink:
+            segment.unlink()
+    except (BufferError, FileNotFoundError):
+        pass
+
+class TorchModel:
+    """A .pt model; a batch is one forward pass."""
+
+    def __init__(self, path):
+        import torch
+        from ultralytics import YOLO
+        from ultralytics.utils import LOGGER
+        LOGGER.setLevel(logging.ERROR)
+        self.torch = torch
+        yolo = YOLO(path)
+        yolo.fuse()
+        self.net = yolo.model.eval()
+        self.info = {"layout": "nchw", "stride": max(int(self.net.stride.max()), 32), "names": yolo.names}
+
+    def run(self, batch):
+        with self.torch.inference_mode():
+            preds = self.net(self.torch.from_numpy(batch))
+        preds = preds[0] if isinstance(preds, (list, tuple)) else preds
+        return preds.numpy()
+
+class TFLiteModel:
+    """A .tflite export; its batch size is fixed at one, so frames run in turn."""
+
+    def __init__(self, path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                from ai_edge_litert.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=path, num_threads=TFLITE_THREADS)
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        _, height, width, _ = (int(v) for v in self.interpreter.get_input_details()[0]["shape"])
+        self.info = {"layout": "nhwc", "input_shape": [height, width]}
+
+    def run(self, batch):
+        outputs = []
+        for frame in batch:
+            self.interpreter.set_tensor(self.input_index, frame[None])
+            self.interpreter.invoke()
+            outputs.append(self.interpreter.get_tensor(self.output_index))
+        return np.concatenate(outputs)
+
+models = {}
+load_lock = threading.Lock()
+
+def load(path):
+    if path not in ALLOWED:
+        raise ValueError(f"Model {path} is not in models or allowed_models")
+    with load_lock:
+        model = models.get(path)
+        if model is None:
+            start = time.perf_counter()
+            model = models[path] = (TFLiteModel if path.endswith(".tflite") else TorchModel)(path)
+            print(f"Loaded {path} in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return model
+
+class Request:
+    def __init__(self, model, inputs):
+        self.model = model
+        self.inputs = inputs
+        self.done = threading.Event()
+        self.output = None
+        self.error = None
+        self.batch = 0
+
+class BatchQueue:
+    """Requests from every connection, drained by one inference thread."""
+
+    def __init__(self, max_batch):
+        self.max_batch = max_batch
+        self.cond = threading.Condition()
+        self.pending = []
+        self.batches = 0
+        self.frames = 0
+
+    def submit(self, request):
+        with self.cond:
+            self.pending.append(request)
+            self.cond.notify()
+        request.done.wait()
+
+    def take(self):
+        """The oldest request and the queued ones it can share a batch with."""
+        with self.cond:
+            while not self.pending:
+                self.cond.wait()
+            first = self.pending[0]
+            key = (first.model, first.inputs.shape[1:])
+            group, frames = [], 0
+            for request in self.pending:
+                if (request.model, request.inputs.shape[1:]) != key:
+                    continue
+                if group and frames + len(request.inputs) > self.max_batch:
+                    break
+                group.append(request)
+                frames += len(request.inputs)
+            for request in group:
+                self.pending.remove(request)
+        return group, frames
+
+    def run(self):
+        while True:
+            group, frames = self.take()
+            try:
+                batch = group[0].inputs if len(group) == 1 else np.concatenate([r.inputs for r in group])
+                output = group[0].model.run(batch)
+            except Exception as e:
+                for request in group:
+                    request.error = e
+                    request.done.set()
+                continue
+            row = 0
+            for request in group:
+                request.output = output[row:row + len(request.inputs)]
+                request.batch = frames
+                row += len(request.inputs)
+                request.done.set()
+            with self.cond:
+                self.batches += 1
+                self.frames += frames
+
+    def stats(self):
+        with self.cond:
+            return {
+                "batches_total": self.batches,
+                "frames_total": self.frames,
+                "queued_requests": len(self.pending),
+                "models": sorted(models)
+            }
+
+queue = BatchQueue(MAX_BATCH)
+
+class Connection(socketserver.StreamRequestHandler):
+    """One replica's model; its calls arrive one at a time."""
+
+    def setup(self):
+        super().setup()
+        self.inputs = None
+        self.output = None
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.dispatch(json.loads(line))
+            except Exception as e:
+                reply = {"error": str(e)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+    def dispatch(self, message):
+        op = message.get("op")
+        if op == "load":
+            return load(message["model"]).info
+        if op == "infer":
+            return self.infer(load(message["model"]), message["shm"], message["shape"])
+        if op == "stats":
+            return queue.stats()
+        raise ValueError(f"Unknown op {op!r}")
+
+    def infer(self, model, name, shape):
+        # The replica grows its segment by replacing it
+        if self.inputs is None or self.inputs.name != name:
+            if self.inputs is not None:
+                close(self.inputs)
+            self.inputs = attach(name)
+        request = Request(model, np.ndarray(shape, dtype=np.float32, buffer=self.inputs.buf))
+        queue.submit(request)
+        if request.error is not None:
+            raise request.error
+        output = request.output.astype(np.float32, copy=False)
+        if self.output is None or self.output.size < output.nbytes:
+            if self.output is not None:
+                close(self.output, unlink=True)
+            self.output = shared_memory.SharedMemory(create=True, size=output.nbytes)
+        np.copyto(np.ndarray(output.shape, dtype=np.float32, buffer=self.output.buf), output)
+        return {"shm": self.output.name, "shape": list(output.shape), "batch": request.batch}
+
+    def finish(self):
+        if self.inputs is not None:
+            close(self.inputs)
+        if self.output is not None:
+            close(self.output, unlink=True)
+        super().finish()
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+if __name__ == "__main__":
+    for path in PRELOAD:
+        load(path)
+    threading.Thread(target=queue.run, daemon=True).start()
+    os.makedirs(os.path.dirname(SOCKET), exist_ok=True)
+    if os.path.exists(SOCKET):
+        os.unlink(SOCKET)
+    with Server(SOCKET, Connection) as server:
+        # Function replicas run as their own user, so they connect through
+        # the socket's group
+        if SOCKET_GROUP:
+            shutil.chown(SOCKET, group=SOCKET_GROUP)
+        os.chmod(SOCKET, 0o660)
+        print(f"Listening on {SOCKET}", file=sys.stderr)
+        server.serve_forever()
@@ -0,0 +1,120 @@
+# Minimal Prometheus text-format metrics for the function runtime, kept in the
+# standard library so the templates don't need another package.
+
+import os
+import threading
+
+# Seconds, from a few ms of postprocessing up to yolo11x on the edge boards
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BATCH_BUCKETS = (1, 2, 3, 4, 6, 8, 16, 32)
+MEMORY_BUCKETS = tuple(mb * 2 ** 20 for mb in (64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 3072, 4096))
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+class Registry:
+    """Counters, gauges and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.help = {}
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.metrics[key] = self.metrics.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.metrics[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.metrics.get(key)
+            if histogram is None:
+                histogram = self.metrics[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.metrics.items(), key=lambda item: item[0])
+            lines = []
+            described = set()
+            for (name, labels), value in items:
+                if name not in described:
+                    described.add(name)
+                    kind, text = self.help.get(name, ("histogram" if isinstance(value, Histogram) else "gauge", name))
+                    lines.append(f"# HELP {name} {text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                if isinstance(value, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {value.count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {value.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {value.count}")
+                else:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+def resident_memory_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+def reset_peak_rss():
+    """Restart the kernel's peak RSS (VmHWM) tracking from the current RSS."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def parse_server_timing(header):
+    """Phase durations in seconds from a "phase;dur=ms, ..." Server-Timing header."""
+    phases = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    phases[name] = float(value) / 1000
+                except ValueError:
+                    pass
+    return phases
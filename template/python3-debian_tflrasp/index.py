@@ -1,20 +1,311 @@
 # Copyright (c) Alex Ellis 2017. All rights reserved.
 # Licensed under the MIT license. See LICENSE file in the project root for full license information.
 
+# Long-lived upstream for the of-watchdog in http mode: the function module (and
+# its model) is imported once per container and warmed up before requests are
+# let through, instead of being reloaded by a forked process on every request.
+
+import hashlib
+import hmac
+import json
+import math
+import os
 import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Reported by the ready endpoint, so a cold start can be split into starting
+# the container, importing the function (with its model) and warming up
+process_start = time.monotonic()
+
+import metrics
+import pipeline
+import profiler
+import singleflight
 from function import handler
+import_seconds = time.monotonic() - process_start
+
+PORT = int(os.getenv("upstream_port", "5000"))
+READY_PATH = os.getenv("ready_path", "/_/ready")
+# The watchdog answers its ready_path itself with only a status code, so the
+# startup report is also served on a path it passes through
+STARTUP_PATH = "/_/startup"
+METRICS_PATH = os.getenv("metrics_path", "/metrics")
+# Hot model swaps through POST /_/model, only enabled when a token is set
+MODEL_PATH = "/_/model"
+ADMIN_TOKEN = os.getenv("admin_token", "")
+# Share one handler call between concurrent requests with identical bodies
+# (opt-in: it hides load from anything sending the same frame repeatedly)
+COALESCE = os.getenv("coalesce", "false").lower() == "true"
+# Reject with 429 and a Retry-After hint instead of queuing when a request
+# is predicted to wait longer than this for the model (0 = never)
+MAX_WAIT = float(os.getenv("max_wait_ms", "0")) / 1000
+
+# warmed is set once warmup has run, ready only if it succeeded (or a model
+# was swapped in since): a function whose model can't run never reports ready
+warmed = threading.Event()
+ready = threading.Event()
+startup = {"import_seconds": round(import_seconds, 4)}
+
+registry = metrics.Registry()
+registry.describe("crowdcount_requests_total", "counter", "Requests served, by HTTP status code")
+registry.describe("crowdcount_request_duration_seconds", "histogram", "Time from reading the request body to writing the response, by priority class")
+registry.describe("crowdcount_phase_duration_seconds", "histogram", "Time spent in each phase of a request, as reported by the handler")
+registry.describe("crowdcount_inferences_total", "counter", "Model invocations")
+registry.describe("crowdcount_batch_size", "histogram", "Frames per model invocation")
+registry.describe("crowdcount_queue_depth", "gauge", "Prepared frames waiting for the model")
+registry.describe("crowdcount_decode_backlog", "gauge", "Requests waiting for a decode thread")
+registry.describe("crowdcount_pending_frames", "gauge", "Frames accepted but not through inference yet")
+registry.describe("crowdcount_predicted_wait_seconds", "gauge", "Predicted wait for the model of a request arriving now")
+registry.describe("crowdcount_inflight_requests", "gauge", "Requests currently being handled")
+registry.describe("crowdcount_coalesced_requests_total", "counter", "Requests answered with the response of an identical request in flight")
+registry.describe("process_resident_memory_bytes", "gauge", "Resident memory size in bytes")
+registry.describe("crowdcount_request_peak_rss_bytes", "histogram", "Peak resident memory while a request was handled")
+registry.describe("crowdcount_model_load_seconds", "gauge", "Time to load the model at startup")
+registry.describe("crowdcount_warmup_seconds", "gauge", "Time spent on warmup inferences at startup")
+registry.describe("crowdcount_model_swaps_total", "counter", "Models swapped in without a restart")
+registry.describe("crowdcount_model_swap_seconds", "gauge", "Time to load and warm up the last swapped-in model")
+registry.set("crowdcount_inflight_requests", 0)
+
+# Sample the next profile_requests requests (or N after an "X-Profile: N"
+# header, which needs admin_token like model swaps) into collapsed-stack files
+# under profile_dir
+profiling = profiler.Profiler(int(os.getenv("profile_requests", "0")))
+
+def observe_batch(size):
+    registry.inc("crowdcount_inferences_total")
+    registry.observe("crowdcount_batch_size", size, buckets=metrics.BATCH_BUCKETS)
+
+# Handlers that split their work into prepare/infer/finish stages get decode
+# overlapped with inference; others are called through handle() as before
+stages = None
+if all(hasattr(handler, name) for name in ("prepare", "infer", "finish")):
+    stages = pipeline.Pipeline(handler, on_batch=observe_batch)
+
+flights = singleflight.Group()
+
+swap_lock = threading.Lock()
+swap_state = {"swapping": None, "last_swap": None}
+
+def swap_model(options):
+    try:
+        result = handler.swap(**options)
+        # The new model warmed up, whatever happened at startup
+        startup.pop("warmup_error", None)
+        ready.set()
+        registry.inc("crowdcount_model_swaps_total")
+        registry.set("crowdcount_model_swap_seconds", result.get("swap_seconds", 0))
+    except Exception as e:
+        result = {**options, "error": str(e)}
+    with swap_lock:
+        swap_state.update(swapping=None, last_swap=result)
+
+def handler_stats():
+    hook = getattr(handler, "stats", None)
+    values = hook() if hook is not None else {}
+    if stages is not None:
+        values.update(stages.stats())
+    values["coalesced_requests_total"] = flights.coalesced
+    return values
+
+def warmup():
+    hook = getattr(handler, "warmup", None)
+    try:
+        if hook is not None:
+            startup.update(hook() or {})
+        ready.set()
+    except Exception as e:
+        startup["warmup_error"] = str(e)
+        print(f"Warmup failed, not ready: {e}", file=sys.stderr)
+    finally:
+        warmed.set()
+
+def collect():
+    """Refresh the gauges that are sampled at scrape time."""
+    registry.set("process_resident_memory_bytes", metrics.resident_memory_bytes())
+    for key in ("model_load_seconds", "warmup_seconds"):
+        if key in startup:
+            registry.set(f"crowdcount_{key}", startup[key])
+    for key, value in handler_stats().items():
+        name = f"crowdcount_{key}"
+        if name not in registry.help:
+            registry.describe(name, "counter" if key.endswith("_total") else "gauge", key.replace("_", " "))
+        registry.set(name, value)
+
+# The kernel's peak RSS (VmHWM) is process-wide, so it is only reset when a
+# request starts with no other in flight; resetting it under a concurrent
+# request would wipe the peak that one is measuring
+peak_lock = threading.Lock()
+peak_users = 0
+
+def peak_rss_begin():
+    """Count a request in; True if it reset the peak, so the peak is its own."""
+    global peak_users
+    with peak_lock:
+        peak_users += 1
+        if peak_users == 1:
+            metrics.reset_peak_rss()
+            return True
+    return False
+
+def peak_rss_end():
+    """Read the peak before counting the request out, so no reset can come first."""
+    global peak_users
+    with peak_lock:
+        peak = metrics.peak_rss_bytes()
+        peak_users -= 1
+    return peak
+
+def observe(status, seconds, headers, peak_rss, priority=None):
+    registry.inc("crowdcount_requests_total", code=status)
+    registry.observe("crowdcount_request_duration_seconds", seconds, **({"priority": priority} if priority else {}))
+    if peak_rss is not None:
+        registry.observe("crowdcount_request_peak_rss_bytes", peak_rss, buckets=metrics.MEMORY_BUCKETS)
+    phases = metrics.parse_server_timing((headers or {}).get("Server-Timing"))
+    for phase, duration in phases.items():
+        registry.observe("crowdcount_phase_duration_seconds", duration, phase=phase)
+    if stages is None and "inference" in phases:
+        # handle() runs one frame per model invocation
+        observe_batch(1)
+
+def admit(req):
+    if MAX_WAIT and stages is not None:
+        wait = stages.predicted_wait()
+        if wait > MAX_WAIT:
+            return {
+                "statusCode": 429,
+                "body": json.dumps({
+                    "status": "rejected",
+                    "message": "Function is saturated",
+                    "predicted_wait_ms": round(wait * 1000, 3)
+                }),
+                "headers": {"Retry-After": max(1, math.ceil(wait - MAX_WAIT))}
+            }
+    return call(req)
+
+def call(req):
+    try:
+        return stages.submit(req) if stages is not None else handler.handle(req)
+    except Exception as e:
+        return {"statusCode": 500, "body": json.dumps({"status": "error", "message": str(e)})}
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body, headers=None, content_type="application/json"):
+        data = body if isinstance(body, bytes) else str(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path in (READY_PATH, STARTUP_PATH):
+            status = 200 if ready.is_set() else 503
+            return self.reply(status, json.dumps({"ready": ready.is_set(), **startup,
+                                                  "uptime_seconds": round(time.monotonic() - process_start, 4)}))
+        if path == "/_/stats":
+            return self.reply(200, json.dumps(handler_stats()))
+        if path == METRICS_PATH:
+            collect()
+            return self.reply(200, registry.render(), content_type="text/plain; version=0.0.4")
+        if path == MODEL_PATH:
+            return self.model_admin()
+        self.invoke()
+
+    def do_POST(self):
+        if self.path.split("?", 1)[0] == MODEL_PATH:
+            return self.model_admin()
+        self.invoke()
+
+    do_PUT = do_POST
+
+    def is_admin(self):
+        return bool(ADMIN_TOKEN) and hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {ADMIN_TOKEN}")
+
+    def model_admin(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if not hasattr(handler, "swap"):
+            return self.reply(404, json.dumps({"status": "error", "message": "Model swaps are not supported"}))
+        if not self.is_admin():
+            return self.reply(403, json.dumps({"status": "error", "message": "Model swaps need admin_token"}))
+        if self.command == "GET":
+            with swap_lock:
+                return self.reply(200, json.dumps(swap_state))
+
+        try:
+            options = json.loads(body)
+        except ValueError:
+            options = None
+        if not isinstance(options, dict) or "path" not in options:
+            return self.reply(400, json.dumps({"status": "error", "message": 'Expected {"path": ...}'}))
+        with swap_lock:
+            if swap_state["swapping"]:
+                return self.reply(409, json.dumps(swap_state))
+            swap_state["swapping"] = options["path"]
+            state = json.dumps(swap_state)
+        # Loading and warmup run next to the requests being served; the
+        # switch happens when they are done
+        threading.Thread(target=swap_model, args=(options,), name="swap", daemon=True).start()
+        self.reply(202, state)
+
+    def invoke(self):
+        # Hold requests routed before warmup finished instead of letting them
+        # pay for graph initialization themselves; their bodies stay unread
+        # until then
+        warmed.wait()
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if not ready.is_set():
+            return self.reply(503, json.dumps({"status": "error", "message": "Function is not ready",
+                                               "warmup_error": startup.get("warmup_error")}))
+        key = hashlib.sha256(self.path.encode() + b"\0" + body).digest() if COALESCE else None
+        # Only the decoded copy is held while the request waits for the model
+        req = body.decode()
+        del body
+
+        registry.inc("crowdcount_inflight_requests")
+        session = profiling.begin(self.headers.get("X-Profile") if self.is_admin() else None)
+        alone = peak_rss_begin()
+        start = time.perf_counter()
+        try:
+            if COALESCE:
+                ret, shared = flights.do(key, lambda: admit(req))
+            else:
+                ret, shared = admit(req), False
+        finally:
+            peak_rss = peak_rss_end()
+            registry.inc("crowdcount_inflight_requests", -1)
 
-def get_stdin():
-    buf = ""
-    while(True):
-        line = sys.stdin.readline()
-        buf += line
-        if line=="":
-            break
-    return buf
+        # Same response shape as the python3-http templates: either a plain
+        # body or a dict with statusCode, body and headers
+        if not isinstance(ret, dict):
+            ret = {"body": "" if ret is None else ret}
+        status = ret.get("statusCode", 200)
+        headers = dict(ret.get("headers") or {})
+        headers["X-Peak-RSS-Bytes"] = peak_rss
+        headers["X-Peak-RSS-Scope"] = "request" if alone else "process"
+        if shared:
+            headers["X-Coalesced"] = "true"
+        if session is not None:
+            headers["X-Profile-File"] = session.finish()
+        self.reply(status, ret.get("body", ""), headers)
+        # A shared response's phases were already counted for the first request
+        observe(status, time.perf_counter() - start, None if shared else headers, peak_rss if alone else None,
+                headers.get("X-Priority"))
 
 if(__name__ == "__main__"):
-    st = get_stdin()
-    ret = handler.handle(st)
-    if ret != None:
-        print(ret)
+    threading.Thread(target=warmup, daemon=True).start()
+    server = ThreadingHTTPServer(("127.0.0.1", PORT), Handler)
+    server.daemon_threads = True
+    print(f"Listening on 127.0.0.1:{PORT}", file=sys.stderr)
+    server.serve_forever()
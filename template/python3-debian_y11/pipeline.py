@@ -0,0 +1,203 @@
+# Staged request pipeline for handlers that split their work into
+# prepare(req) -> job, infer(jobs) and finish(job) -> response. prepare (parse,
+# decode, letterbox) runs on a pool of decode threads, so it overlaps with the
+# model working on earlier requests. Requests are classified before they are
+# decoded and wait for a decode thread in priority order. Prepared jobs wait in
+# bounded queues, one per priority class, for the single inference worker,
+# which takes everything
+# that has queued up (up to the handler's max_batch) as one batch; infer()
+# returns the size of each model invocation it made. finish (postprocess,
+# serialize) runs back on the request's own thread while the model moves on.
+
+import collections
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+DECODE_WORKERS = int(os.getenv("decode_workers", "0")) or os.cpu_count() or 1
+# Prepared frames of each priority class waiting for the model. When the live
+# queue is full the decode threads block; a batch request is only decoded once
+# the batch queue has a place for it, so a batch backlog never holds a decode
+# thread. At most decode_workers + 2 * pipeline_depth + max_batch frames are
+# held at once
+PIPELINE_DEPTH = int(os.getenv("pipeline_depth", "2"))
+# Weight of the latest batch in the running per-frame service time
+SERVICE_ALPHA = 0.2
+# Requests are classified by their "priority" field before decoding and jobs
+# carry a priority attribute; live frames are decoded and go to the model
+# first, batch frames that have waited longer than priority_aging_ms go before
+# them
+PRIORITIES = ("live", "batch")
+PRIORITY_AGING = float(os.getenv("priority_aging_ms", "2000")) / 1000
+# A top-level "priority" field, found without parsing the image around it
+PRIORITY_FIELD = re.compile(r'"priority"\s*:\s*"([^"\\]*)"')
+
+def classify(req):
+    """The priority class a request asks for; the handler still validates it."""
+    at = req.find('"priority"')
+    match = PRIORITY_FIELD.match(req, at) if at >= 0 else None
+    priority = match.group(1) if match else PRIORITIES[0]
+    return priority if priority in PRIORITIES else PRIORITIES[0]
+
+class ClassQueue:
+    """FIFOs, one per priority class, bounded to depth entries (None for no bound).
+
+    Places can be reserved ahead of an item, so whoever will produce it knows
+    its put won't block.
+    """
+
+    def __init__(self, depth, aging, cond=None):
+        self.depth = depth
+        self.aging = aging
+        self.cond = cond or threading.Condition()
+        self.queues = {name: collections.deque() for name in PRIORITIES}
+        self.reserved = dict.fromkeys(PRIORITIES, 0)
+        self.promoted = 0
+
+    def room(self, priority):
+        """Whether a place is free in priority's queue; call with cond held."""
+        return self.depth is None or len(self.queues[priority]) + self.reserved[priority] < self.depth
+
+    def put(self, item, priority, reservation=None):
+        """Queue item, using up the place reserved in reservation's queue if any."""
+        with self.cond:
+            if reservation is not None:
+                self.reserved[reservation] -= 1
+            if reservation != priority:
+                while not self.room(priority):
+                    self.cond.wait()
+            self.queues[priority].append((time.monotonic(), item))
+            self.cond.notify_all()
+
+    def take(self, limit):
+        """Wait for at least one item, then take up to limit in priority order."""
+        with self.cond:
+            while not any(self.queues.values()):
+                self.cond.wait()
+            items = []
+            while len(items) < limit and any(self.queues.values()):
+                items.append(self.pop())
+            self.cond.notify_all()
+        return items
+
+    def pop(self, take_batch=True):
+        live, batch = self.queues["live"], self.queues["batch"]
+        if take_batch and batch and (not live or time.monotonic() - batch[0][0] > self.aging):
+            if live:
+                self.promoted += 1
+            return batch.popleft()[1]
+        return live.popleft()[1]
+
+    def sizes(self):
+        with self.cond:
+            return {name: len(entries) for name, entries in self.queues.items()}
+
+class Pipeline:
+    def __init__(self, handler, on_batch=None):
+        self.handler = handler
+        self.max_batch = max(1, int(getattr(handler, "max_batch", 1)))
+        self.on_batch = on_batch
+        self.lock = threading.Lock()
+        # Frames submitted but not through inference yet, and the running
+        # average of the inference time per frame
+        self.pending = 0
+        self.service = None
+        # Requests waiting for a decode thread and prepared jobs waiting for
+        # the model, under one condition so decoders see the model's progress
+        cond = threading.Condition()
+        self.requests = ClassQueue(None, PRIORITY_AGING, cond)
+        self.queue = ClassQueue(PIPELINE_DEPTH, PRIORITY_AGING, cond)
+        self.decoders = [threading.Thread(target=self.decode, name=f"decode_{i}", daemon=True)
+                         for i in range(DECODE_WORKERS)]
+        for decoder in self.decoders:
+            decoder.start()
+        self.worker = threading.Thread(target=self.run, name="inference", daemon=True)
+        self.worker.start()
+
+    def submit(self, req):
+        """Run req through the three stages and return the handler's response."""
+        done = Future()
+        with self.lock:
+            self.pending += 1
+        priority = classify(req)
+        self.requests.put((req, done, priority), priority)
+        return self.handler.finish(done.result())
+
+    def next_request(self):
+        """Wait for a request to decode: live ones first, batch ones only once a
+        place in the model's batch queue is reserved for them."""
+        with self.requests.cond:
+            while True:
+                take_batch = self.queue.room("batch")
+                if self.requests.queues["live"] or (take_batch and self.requests.queues["batch"]):
+                    break
+                self.requests.cond.wait()
+            req, done, priority = self.requests.pop(take_batch)
+            reservation = None
+            if priority == "batch":
+                reservation = priority
+                self.queue.reserved[priority] += 1
+        return req, done, reservation
+
+    def decode(self):
+        while True:
+            req, done, reservation = self.next_request()
+            try:
+                job = self.handler.prepare(req)
+            except BaseException as e:
+                if reservation is not None:
+                    with self.queue.cond:
+                        self.queue.reserved[reservation] -= 1
+                        self.queue.cond.notify_all()
+                self.finished(1)
+                done.set_exception(e)
+                continue
+            priority = getattr(job, "priority", PRIORITIES[0])
+            self.queue.put((job, done), priority if priority in PRIORITIES else PRIORITIES[0], reservation)
+
+    def run(self):
+        while True:
+            batch = self.queue.take(self.max_batch)
+            start = time.perf_counter()
+            try:
+                sizes = self.handler.infer([job for job, _ in batch])
+            except Exception as e:
+                self.finished(len(batch))
+                for _, done in batch:
+                    done.set_exception(e)
+                continue
+            # Jobs that failed before inference don't count towards the service time
+            frames = sum(sizes or ())
+            self.finished(len(batch), (time.perf_counter() - start) / frames if frames else None)
+            if self.on_batch is not None:
+                for size in sizes or ():
+                    self.on_batch(size)
+            for job, done in batch:
+                done.set_result(job)
+
+    def finished(self, frames, service=None):
+        with self.lock:
+            self.pending -= frames
+            if service is not None:
+                average = self.service
+                self.service = service if average is None else average + SERVICE_ALPHA * (service - average)
+
+    def predicted_wait(self):
+        """Seconds a frame submitted now would wait for the frames ahead of it."""
+        with self.lock:
+            return self.pending * (self.service or 0.0)
+
+    def stats(self):
+        queued = self.queue.sizes()
+        return {
+            "decode_backlog": sum(self.requests.sizes().values()),
+            "queue_depth": sum(queued.values()),
+            **{f"queue_depth_{name}": size for name, size in queued.items()},
+            "priority_promotions_total": self.queue.promoted,
+            "pending_frames": self.pending,
+            "predicted_wait_seconds": round(self.predicted_wait(), 4),
+            "decode_workers": DECODE_WORKERS,
+            "max_batch": self.max_batch
+        }
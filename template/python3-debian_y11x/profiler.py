@@ -0,0 +1,116 @@
+# On-demand sampling profiler for the function runtime. While armed, each
+# request gets a sampler thread that records the Python stacks of the other
+# threads every few milliseconds and writes them in the collapsed-stack format
+# read by flamegraph.pl and speedscope. When nothing is armed the only cost is
+# one counter check per request.
+
+import collections
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+PROFILE_DIR = os.getenv("profile_dir", "/tmp/profiles")
+# Seconds between samples; anything below 0.1 ms (including zero or a
+# negative value) is taken as 0.1 ms
+PROFILE_INTERVAL = max(float(os.getenv("profile_interval_ms", "5")), 0.1) / 1000
+# Native frames come from py-spy, which has to be installed in the image and
+# allowed to ptrace the function process
+PROFILE_NATIVE = os.getenv("profile_native", "false").lower() == "true"
+# Most requests one arming profiles, and most profiles kept in profile_dir;
+# older ones are deleted as new ones are written
+PROFILE_MAX_REQUESTS = int(os.getenv("profile_max_requests", "20"))
+PROFILE_KEEP = int(os.getenv("profile_keep", "50"))
+
+class Profiler:
+    def __init__(self, requests=0):
+        self.lock = threading.Lock()
+        self.remaining = requests
+        self.sequence = 0
+
+    def arm(self, requests):
+        with self.lock:
+            self.remaining = max(self.remaining, min(requests, PROFILE_MAX_REQUESTS))
+
+    def begin(self, header=None):
+        """Start a session for this request if profiling is armed, else None.
+
+        header is the X-Profile value of an authorized request.
+        """
+        if header:
+            try:
+                self.arm(int(header))
+            except ValueError:
+                pass
+        if not self.remaining:
+            return None
+        with self.lock:
+            if not self.remaining:
+                return None
+            self.remaining -= 1
+            self.sequence += 1
+            name = f"{int(time.time() * 1000)}-{self.sequence}"
+        return Session(os.path.join(PROFILE_DIR, name))
+
+class Session:
+    def __init__(self, path):
+        self.path = path
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+        self.native = None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if PROFILE_NATIVE and shutil.which("py-spy"):
+            self.native = subprocess.Popen(
+                ["py-spy", "record", "--pid", str(os.getpid()), "--native", "--format", "raw",
+                 "--rate", str(max(int(1 / PROFILE_INTERVAL), 1)), "--output", path + ".native.collapsed"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.thread = threading.Thread(target=self.sample, name="profiler", daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        me = threading.get_ident()
+        main = threading.main_thread().ident  # only ever waits in serve_forever
+        while not self.stopped.wait(PROFILE_INTERVAL):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident in (me, main):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def finish(self):
+        """Stop sampling, write the collapsed stacks and return the file path."""
+        self.stopped.set()
+        self.thread.join()
+        if self.native is not None:
+            self.native.send_signal(signal.SIGINT)
+            self.native.wait()
+        path = self.path + ".collapsed"
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        prune()
+        return path
+
+def prune(keep=PROFILE_KEEP):
+    """Delete all but the newest keep profiles (with their native files)."""
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if name.endswith(".collapsed")]
+    except FileNotFoundError:
+        return
+    paths = sorted((os.path.join(PROFILE_DIR, name) for name in names), key=os.path.getmtime, reverse=True)
+    # A profile is its Python file plus, with profile_native, a native one
+    per_profile = 2 if PROFILE_NATIVE else 1
+    for path in paths[keep * per_profile:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass